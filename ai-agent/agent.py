@@ -1,38 +1,111 @@
-import json
-import requests
 import asyncio
+import time
 
+from answer_cache import AnswerCache
+from escalation import EscalationClient, EscalationError
+from kb_store import KnowledgeBaseStore
+from kb_sync import KnowledgeSync
+from metrics import registry
 
-with open('knowledge_base.json', 'r') as f:
-    kb = json.load(f)
+# optional tuning, config.py only has to define the LiveKit settings
+try:
+    import config
+except ImportError:
+    config = None
+
+MATCH_MODE = getattr(config, "MATCH_MODE", "first")  # "first" or "ranked"
+RANKED_MIN_SCORE = getattr(config, "RANKED_MIN_SCORE", 0.35)
+MATCH_EXECUTOR = getattr(config, "MATCH_EXECUTOR", "inline")  # "inline" or "process"
+MATCH_WORKERS = getattr(config, "MATCH_WORKERS", None)  # default: one per CPU
+KB_SNAPSHOT_PATH = getattr(config, "KB_SNAPSHOT_PATH", None)  # e.g. "knowledge_base.kbs"
+ANSWER_CACHE_SIZE = getattr(config, "ANSWER_CACHE_SIZE", 1024)
+ANSWER_CACHE_TTL = getattr(config, "ANSWER_CACHE_TTL", 300)  # seconds
+
+# loaded on first use and reloaded only when the backend rewrites the file
+kb_store = KnowledgeBaseStore('knowledge_base.json', snapshot_path=KB_SNAPSHOT_PATH)
+# applies the backend's pushed changes while the agent is connected to ws_server
+kb_sync = KnowledgeSync(kb_store)
+
+# answers to repeated questions, emptied whenever the knowledge base version changes
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+
+escalation_client = EscalationClient()
+
+matching_pool = None  # set by start_matching_pool()
+
+match_seconds = registry.histogram("kb_match_seconds", "Knowledge base matching time for questions not in the answer cache")
+lookups = {result: registry.counter("kb_lookups_total", "Questions looked up, by result", result=result)
+           for result in ("cached", "matched", "unmatched")}
+registry.gauge("kb_entries", lambda: len(kb_store.current), "Entries in the loaded knowledge base")
+registry.gauge("kb_version", lambda: kb_store.version, "Knowledge base version, bumped by every reload or delta")
+registry.gauge("answer_cache_entries", lambda: len(answer_cache), "Answers held in the answer cache")
+
+def _count_lookup(answer, cached):
+    lookups["cached" if cached else "matched" if answer is not None else "unmatched"].inc()
+
+def answer_key(user_input):
+    """Answer cache key: exactly the text the matcher sees, so a cached answer is the one it would give"""
+    # not normalize_question: the substring rules match stop words and punctuation too, so
+    # phrasings sharing a normalized key can match different entries
+    return user_input.lower()
 
 def find_answer(user_input):
     """Find answer from knowledge base with improved matching"""
-    try:
-        with open('knowledge_base.json', 'r') as f:
-            kb = json.load(f)
-        print(f"Loaded {len(kb)} entries from knowledge base")
-    except Exception as e:
-        print(f"Error loading knowledge base: {e}")
-        kb = [] 
-    
-    user_input = user_input.lower()
-    
-    for item in kb:
-        if "question" in item and item["question"].lower() in user_input:
-            return item["answer"]
-    
-    for item in kb:
-        if "question" in item:
-            question_words = set(item["question"].lower().split())
-            input_words = set(user_input.split())
-            
-            # If 50% or more of the question words are in the input, consider it a match
-            overlap = question_words.intersection(input_words)
-            if len(overlap) >= len(question_words) / 2:
-                return item["answer"]
-    
-    return None  
+    snapshot = kb_store.snapshot()
+    key = answer_key(user_input)
+    answer = answer_cache.get(key, snapshot.version)
+    cached = answer is not None
+    if not cached:
+        start = time.perf_counter()
+        answer = snapshot.answer(user_input, MATCH_MODE, RANKED_MIN_SCORE)
+        match_seconds.record(time.perf_counter() - start)
+        if answer is not None:
+            answer_cache.put(key, answer, snapshot.version)
+    _count_lookup(answer, cached)
+    return answer
+
+def warm_up():
+    """Load the knowledge base (and the ranker in ranked mode) ahead of the first question.
+
+    Blocking; agents run it in a thread while they join their room.
+    Returns the number of entries loaded.
+    """
+    snapshot = kb_store.snapshot()
+    if MATCH_MODE == "ranked":
+        snapshot.ranker
+    return len(snapshot)
+
+def start_matching_pool():
+    """Fork the matching workers if MATCH_EXECUTOR is "process"; call before starting other threads"""
+    global matching_pool
+    if MATCH_EXECUTOR == "process" and matching_pool is None:
+        from match_pool import MatchingPool
+        matching_pool = MatchingPool(kb_store, MATCH_WORKERS, MATCH_MODE, RANKED_MIN_SCORE)
+        matching_pool.start()
+    return matching_pool
+
+async def find_answer_async(user_input):
+    """find_answer for the event loop, run in the matching pool when there is one"""
+    if matching_pool is None:
+        return find_answer(user_input)
+    version = kb_store.snapshot().version
+    key = answer_key(user_input)
+    answer = answer_cache.get(key, version)
+    cached = answer is not None
+    if not cached:
+        start = time.perf_counter()
+        answer = await matching_pool.match(user_input)
+        match_seconds.record(time.perf_counter() - start)
+        if answer is not None:
+            answer_cache.put(key, answer, version)
+    _count_lookup(answer, cached)
+    return answer
+
+def rank_answers(queries, k=3, min_score=None):
+    """Score a batch of questions against every entry, returning the top-k matches for each"""
+    if min_score is None:
+        min_score = RANKED_MIN_SCORE
+    return kb_store.snapshot().ranker.rank_many(queries, k, min_score)
 
 async def handle_call(user_input: str):
     """Process incoming call/message"""
@@ -42,14 +115,11 @@ async def handle_call(user_input: str):
         return answer
     else:
         print(f"[AI Agent]: I'm not sure. Escalating this to a supervisor...")
-        payload = {
-            "question": user_input
-        }
         try:
-            res = requests.post("http://localhost:5000/api/v1/helpreq", json=payload)
+            res = await escalation_client.submit(user_input)
             print(f"[System]: Escalation created: {res.status_code}")
             return "I'm not sure about that. I've sent your question to a supervisor who can help."
-        except Exception as e:
+        except EscalationError as e:
             print(f"[System Error]: Failed to escalate: {e}")
             return "I'm not sure about that, and I'm having trouble connecting to our help desk. Please try again later."
 
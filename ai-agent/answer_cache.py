@@ -0,0 +1,70 @@
+import time
+from collections import Counter, OrderedDict
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL = 300  # seconds
+
+
+class AnswerCache:
+    """LRU cache of knowledge base answers keyed by question.
+
+    Every entry belongs to the knowledge base version it was answered from;
+    the first lookup against a different version empties the cache, so an
+    edit to the knowledge base is never hidden by a stale answer. Only found
+    answers are cached, a miss always goes back to the matcher.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self.counts = Counter()       # hits, misses, expired, evicted, invalidations
+        self._entries = OrderedDict()  # key -> (answer, expires_at), least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.counts['invalidations'] += 1
+                self._entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        """The cached answer for key under this knowledge base version, or None"""
+        self._check_version(version)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counts['misses'] += 1
+            return None
+        answer, expires_at = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.counts['expired'] += 1
+            self.counts['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counts['hits'] += 1
+        return answer
+
+    def put(self, key, answer, version):
+        self._check_version(version)
+        self._entries[key] = (answer, self.clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.counts['evicted'] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.counts['hits'] + self.counts['misses']
+        return {
+            'entries': len(self._entries),
+            'version': self.version,
+            'hit_rate': round(self.counts['hits'] / lookups, 4) if lookups else 0.0,
+            **self.counts
+        }
@@ -0,0 +1,90 @@
+"""Write throughput and recovery time of the help request journal.
+
+Creates --requests help requests through a journaled HelpRequestStore
+(answering every other one), then measures how long the writer takes to make
+them durable, how fast the writer goes on its own, how long a restart takes to replay the log (compacting it on
+the way) and how long the restart after that takes. Run from the ai-agent
+directory:
+
+    python benchmarks/bench_help_request_log.py --requests 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from help_request_log import HelpRequestLog
+from help_request_store import HelpRequestStore
+
+
+def recover(path, fsync):
+    store = HelpRequestStore()
+    start = time.perf_counter()
+    log = HelpRequestLog(path, fsync=fsync).open(store)
+    elapsed = time.perf_counter() - start
+    log.close()
+    return store, elapsed
+
+
+def time_writer(path, ops, fsync):
+    """Seconds for the writer alone to make ops durable, queued all at once"""
+    log = HelpRequestLog(path, fsync=fsync).open(HelpRequestStore())
+    start = time.perf_counter()
+    for op in ops:
+        log.record(*op)
+    log.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000000)
+    parser.add_argument("--no-fsync", action="store_true", help="skip fsync after each batch")
+    parser.add_argument("--max-recovery", type=float, default=0, help="fail if replaying takes longer (seconds)")
+    args = parser.parse_args()
+    fsync = not args.no_fsync
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "help_requests.log")
+        store = HelpRequestStore()
+        log = HelpRequestLog(path, fsync=fsync).open(store)
+
+        start = time.perf_counter()
+        for i in range(args.requests):
+            request_id = f"req-{i}"
+            store.add(request_id, f"do you have appointments on day {i % 365}?", f"caller-{i % 5000}",
+                      caller_ids=[f"caller-{i % 5000}"], agent_id="bench-agent")
+            if i % 2:
+                store.update(request_id, status="answered", answer=f"answer {i}")
+        queued = time.perf_counter() - start
+        log.close()
+        durable = time.perf_counter() - start
+        stats = log.stats()
+
+        print(f"{args.requests} requests, {stats['written']} log operations, "
+              f"{os.path.getsize(path) / 1e6:.0f} MB, fsync {'on' if fsync else 'off'}")
+        print(f"handlers:   {stats['written'] / queued:10.0f} ops/s  ({queued:.2f}s, never waited on disk)")
+        print(f"durable:    {stats['written'] / durable:10.0f} ops/s  ({durable:.2f}s, "
+              f"{stats['batches']} batches of {stats['written'] / max(stats['batches'], 1):.0f} on average)")
+
+        ops = [("add", f"w-{i}", {"question": "do you open on sundays?", "caller_id": "c", "status": "pending",
+                                  "created_at": "2026-01-01T00:00:00"}) for i in range(min(args.requests, 200000))]
+        writer = time_writer(os.path.join(tmp, "writer.log"), ops, fsync)
+        print(f"writer:     {len(ops) / writer:10.0f} ops/s  (alone, {len(ops)} adds)")
+
+        recovered, first = recover(path, fsync)
+        print(f"recovery:   {first:10.2f}s     ({len(recovered)} requests, log compacted to "
+              f"{os.path.getsize(path) / 1e6:.0f} MB)")
+        _, second = recover(path, fsync)
+        print(f"compacted:  {second:10.2f}s")
+
+    if args.max_recovery and first > args.max_recovery:
+        print(f"FAIL: recovery took over {args.max_recovery}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
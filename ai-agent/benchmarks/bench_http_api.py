@@ -0,0 +1,73 @@
+"""Requests/sec benchmark for the ws_server.py help-request API.
+
+Starts the API on a local port inside this process and drives it with
+concurrent keep-alive clients, half of them creating help requests and
+half polling the list. Run from the ai-agent directory:
+
+    python benchmarks/bench_http_api.py --clients 50 --requests 200 --target 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ws_server
+
+
+async def client(port, count, post):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    latencies = []
+    for i in range(count):
+        if post:
+            body = json.dumps({"question": f"bench question {i}", "caller_id": "bench"}).encode()
+            head = f"POST /api/v1/helpreq HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n\r\n"
+        else:
+            body = b""
+            head = "GET /api/v1/helpreq?limit=20 HTTP/1.1\r\nHost: x\r\n\r\n"
+        start = time.perf_counter()
+        writer.write(head.encode() + body)
+        await writer.drain()
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = int(headers.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    return latencies
+
+
+async def run(clients, requests, port):
+    ws_server.api_server.log_requests = False
+    server = await ws_server.api_server.start("127.0.0.1", port)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = await asyncio.gather(*[client(port, requests, i % 2 == 0) for i in range(clients)])
+    elapsed = time.perf_counter() - start
+    server.close()
+    latencies = sorted(l for r in results for l in r)
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--target", type=float, default=0, help="fail if requests/sec is below this")
+    args = parser.parse_args()
+
+    rate, latencies = asyncio.run(run(args.clients, args.requests, args.port))
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{len(latencies)} requests, {rate:.0f} req/s, p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+    if args.target and rate < args.target:
+        print(f"FAIL: below target of {args.target:.0f} req/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Cold import time of the agent modules, and a check that nothing heavy loads early.
+
+Imports each module in a fresh interpreter --runs times and reports the
+median. Fails if an import is slower than --budget milliseconds or pulls in
+livekit, websockets or requests, which should only load on first use. Run
+from the ai-agent directory:
+
+    python benchmarks/bench_import_time.py --runs 10 --budget 100
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("agent", "livekit_agent", "runtime")
+HEAVY = ("livekit", "websockets", "requests")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+# only used when there is no config.py, the modules read it at import time
+PLACEHOLDER_CONFIG = 'HOST = "example"\nAPI_KEY = "key"\nAPI_SECRET = "secret"\nROOM_NAME = "salon"\n'
+
+
+def time_import(module, env):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                         cwd=AGENT_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    elapsed, loaded = out.split(" ", 1)
+    return float(elapsed), [m for m in loaded.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=100, help="fail if a median import takes longer (ms)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp:
+        if not os.path.exists(os.path.join(AGENT_DIR, "config.py")):
+            with open(os.path.join(tmp, "config.py"), "w") as f:
+                f.write(PLACEHOLDER_CONFIG)
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [tmp, env.get("PYTHONPATH")]))
+
+        failed = False
+        for module in MODULES:
+            samples = []
+            for _ in range(args.runs):
+                elapsed, loaded = time_import(module, env)
+                samples.append(elapsed * 1000)
+            median = statistics.median(samples)
+            print(f"{module:15s} median {median:7.1f}ms  max {max(samples):7.1f}ms")
+            if loaded:
+                print(f"FAIL: importing {module} loaded {', '.join(loaded)}")
+                failed = True
+            if median > args.budget:
+                print(f"FAIL: {module} is over the {args.budget:.0f}ms budget")
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
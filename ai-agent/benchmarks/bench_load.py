@@ -0,0 +1,365 @@
+"""Load test: simulated callers and supervisors against SalonAIAgent and ws_server.
+
+Everything runs in this process. ws_server's HTTP API and WebSocket endpoints
+listen on local ports, the agent joins a FakeRoom that stands in for LiveKit,
+and --callers closed-loop callers each ask a question, wait for the reply and
+ask the next. A share of the questions (--unknown-rate) are not in the
+knowledge base; the agent escalates them and --supervisors simulated
+supervisors, polling the help request API, answer them after
+--supervisor-delay. Each knowledge base size in --entries gets its own
+synthetic knowledge base and a run of --duration seconds. Reports
+throughput, answer latency, escalation acknowledgement latency, escalation
+to supervisor answer round trip and process memory. Run from the ai-agent
+directory:
+
+    python benchmarks/bench_load.py --entries 100 1000 10000 100000 --callers 50 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # livekit_agent reads the LiveKit settings at import time; the load test never uses them
+    _config_dir = tempfile.mkdtemp(prefix="bench-config-")
+    with open(os.path.join(_config_dir, "config.py"), "w") as f:
+        f.write('HOST = "bench"\nAPI_KEY = "bench"\nAPI_SECRET = "bench"\nROOM_NAME = "bench"\n')
+    sys.path.insert(0, _config_dir)
+
+import websockets
+
+import agent
+import envelope
+import livekit_agent
+import ws_server
+from escalation import EscalationClient
+from metrics import Histogram
+
+WORDS = ("hair cut color price booking weekend open close nails spa facial massage "
+         "appointment cancel parking gift card student discount bridal wax brow lash "
+         "style trim keratin perm highlight balayage manicure pedicure hours staff").split()
+REPLY_TIMEOUT = 10.0  # seconds a caller waits for the agent before counting a timeout
+
+
+def synthetic_kb(entries, rng):
+    return [{
+        "id": str(i),
+        "question": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + f" item{i}",
+        "answer": f"answer {i}"
+    } for i in range(entries)]
+
+
+def rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # peak, not current
+
+
+class FakeParticipant:
+    def __init__(self, identity):
+        self.identity = identity
+
+
+class FakePacket:
+    """What rtc.Room passes to data_received handlers"""
+
+    def __init__(self, data, participant_identity):
+        self.data = data
+        self.participant_identity = participant_identity
+
+
+class FakeLocalParticipant:
+    def __init__(self, room):
+        self.room = room
+
+    async def publish_data(self, payload, reliable=True, destination_identities=None, topic=None):
+        self.room.deliver(payload, destination_identities)
+
+
+class FakeRoom:
+    """In-process stand-in for rtc.Room: callers join it directly and nothing touches the network"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.participants = {}
+        self.callers = {}  # identity -> Caller receiving what the agent publishes
+        self.local_participant = FakeLocalParticipant(self)
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def connect(self, url, token):
+        pass
+
+    def get_participant_by_identity(self, identity):
+        return self.participants.get(identity)
+
+    def join(self, caller):
+        participant = self.participants[caller.identity] = FakeParticipant(caller.identity)
+        self.callers[caller.identity] = caller
+        self.handlers["participant_connected"](participant)
+
+    def leave(self, caller):
+        participant = self.participants.pop(caller.identity)
+        del self.callers[caller.identity]
+        self.handlers["participant_disconnected"](participant)
+
+    def send(self, identity, payload):
+        self.handlers["data_received"](FakePacket(payload, identity))
+
+    def deliver(self, payload, destinations):
+        message = json.loads(payload)
+        for identity in destinations or list(self.callers):
+            caller = self.callers.get(identity)
+            if caller is not None:
+                caller.receive(message)
+
+
+class BenchAgent(livekit_agent.SalonAIAgent):
+    def _join_token(self):
+        return "bench"
+
+
+class Results:
+    def __init__(self):
+        self.answer = Histogram()        # question -> KB answer
+        self.escalation = Histogram()    # question -> "sent to a supervisor"
+        self.supervisor = Histogram()    # question -> supervisor's answer
+        self.errors = 0
+        self.timeouts = 0
+
+
+class Caller:
+    def __init__(self, identity, room, questions, results, rng):
+        self.identity = identity
+        self.room = room
+        self.questions = questions
+        self.results = results
+        self.rng = rng
+        self.waiting = {}    # correlation id -> future for the agent's first reply
+        # help request id -> when each question escalated to it was asked; a caller
+        # who asks again while the request is open gets one answer for both
+        self.escalated = {}
+        # when each request's supervisor answer arrived; joining a request already in
+        # flight can see it answered before the agent's "sent to a supervisor" reply
+        self.answered = {}
+
+    def receive(self, message):
+        if message["type"] == envelope.SUPERVISOR_ANSWER:
+            now = time.perf_counter()
+            request_id = message.get("request_id")
+            self.answered[request_id] = now
+            for asked in self.escalated.pop(request_id, ()):
+                self.results.supervisor.record(now - asked)
+            return
+        future = self.waiting.pop(message.get("correlation_id"), None)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    async def run(self, deadline, think):
+        loop = asyncio.get_running_loop()
+        while time.perf_counter() < deadline:
+            question = self.rng.choice(self.questions)
+            correlation_id = uuid.uuid4().hex
+            future = self.waiting[correlation_id] = loop.create_future()
+            asked = time.perf_counter()
+            self.room.send(self.identity, json.dumps({"message": question,
+                                                      "correlation_id": correlation_id}).encode("utf-8"))
+            try:
+                reply = await asyncio.wait_for(future, REPLY_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.waiting.pop(correlation_id, None)
+                self.results.timeouts += 1
+                continue
+            elapsed = time.perf_counter() - asked
+            if reply["type"] == envelope.ANSWER:
+                self.results.answer.record(elapsed)
+            elif reply["type"] == envelope.ESCALATION:
+                self.results.escalation.record(elapsed)
+                answered = self.answered.get(reply["request_id"])
+                if answered is not None:
+                    self.results.supervisor.record(answered - asked)
+                else:
+                    self.escalated.setdefault(reply["request_id"], []).append(asked)
+            else:
+                self.results.errors += 1
+            if think:
+                await asyncio.sleep(think)
+
+
+async def http_get_json(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def supervisor(index, count, ws_url, http_port, delay, poll_interval, stop):
+    """Answer this supervisor's share of pending help requests, delay seconds after noticing each"""
+    async with websockets.connect(ws_url) as ws:
+        async def drain_confirmations():
+            async for _ in ws:
+                pass
+
+        async def answer_later(request_id):
+            await asyncio.sleep(delay)
+            await ws.send(json.dumps({"type": "answer_help_request", "request_id": request_id,
+                                      "answer": f"supervisor {index} says yes"}))
+
+        reader = asyncio.create_task(drain_confirmations())
+        seen = set()
+        watermark = 0
+        while not stop.is_set():
+            page = await http_get_json(http_port, f"/api/v1/helpreq?status=pending&since={watermark}&limit=500")
+            for item in page["items"]:
+                request_id = item["request_id"]
+                if request_id not in seen and hash(request_id) % count == index:
+                    seen.add(request_id)
+                    asyncio.create_task(answer_later(request_id))
+            watermark = page["watermark"]
+            if len(page["items"]) < 500:
+                await asyncio.sleep(poll_interval)
+        reader.cancel()
+
+
+async def run_scenario(entries, args, ports, tmp):
+    rng = random.Random(args.seed)
+    kb = synthetic_kb(entries, rng)
+    path = os.path.join(tmp, f"kb-{entries}.json")
+    with open(path, "w") as f:
+        json.dump(kb, f)
+    agent.kb_store.path = path
+    agent.kb_store.refresh()
+    agent.answer_cache.clear()
+    rss_before = rss_mb()
+
+    known = [item["question"] for item in kb]
+    unknown = [f"zq{i} vx{i} could you do something unusual" for i in range(args.unknown_questions)]
+    http_port, agent_port, supervisor_port = ports
+
+    room = FakeRoom()
+    escalations = EscalationClient(url=f"http://127.0.0.1:{http_port}/api/v1/helpreq",
+                                   agent_id=livekit_agent.BACKEND_AGENT_ID)
+    bench_agent = BenchAgent(f"bench-{entries}", escalations=escalations, follow_backend=False, room=room)
+    if not await bench_agent.connect():
+        sys.exit("agent failed to start")
+    backend = asyncio.create_task(livekit_agent.follow_backend_updates(
+        bench_agent._handle_websocket_message, url=f"ws://127.0.0.1:{agent_port}"))
+
+    stop = asyncio.Event()
+    supervisors = [asyncio.create_task(supervisor(i, args.supervisors, f"ws://127.0.0.1:{supervisor_port}",
+                                                  http_port, args.supervisor_delay, 0.05, stop))
+                   for i in range(args.supervisors)]
+
+    results = Results()
+    callers = []
+    for i in range(args.callers):
+        caller_rng = random.Random(args.seed * 1000003 + i)
+        # each caller's question mix is fixed by the seed: mostly known questions, some unknown
+        questions = [caller_rng.choice(unknown) if caller_rng.random() < args.unknown_rate
+                     else caller_rng.choice(known) for _ in range(200)]
+        caller = Caller(f"caller-{i}", room, questions, results, caller_rng)
+        room.join(caller)
+        callers.append(caller)
+
+    await asyncio.sleep(0.5)  # let the backend connection and welcomes settle
+    start = time.perf_counter()
+    await asyncio.gather(*[caller.run(start + args.duration, args.think) for caller in callers])
+    elapsed = time.perf_counter() - start
+    # give supervisors time to answer what was escalated near the end
+    waiting = lambda: sum(len(asked) for caller in callers for asked in caller.escalated.values())
+    settle_until = time.perf_counter() + args.supervisor_delay + 2.0
+    while waiting() and time.perf_counter() < settle_until:
+        await asyncio.sleep(0.05)
+
+    stop.set()
+    await asyncio.gather(*supervisors, return_exceptions=True)
+    backend.cancel()
+    for caller in callers:
+        room.leave(caller)
+    await bench_agent.scheduler.stop()
+    escalations.close()
+
+    replies = results.answer.count + results.escalation.count + results.errors
+    return {
+        "entries": entries,
+        "replies_per_sec": replies / elapsed,
+        "answer": results.answer,
+        "escalation": results.escalation,
+        "supervisor": results.supervisor,
+        "unanswered_escalations": waiting(),
+        "errors": results.errors,
+        "timeouts": results.timeouts,
+        "rss_before": rss_before,
+        "rss_after": rss_mb()
+    }
+
+
+def ms(histogram, q):
+    return histogram.percentile(q) * 1000
+
+
+async def main_async(args):
+    livekit_agent.VERBOSE = False
+    ws_server.VERBOSE = False
+    ws_server.api_server.log_requests = False
+
+    http_server = await ws_server.api_server.start("127.0.0.1", 0)
+    agent_server = await websockets.serve(ws_server.ws_server.agent_handler, "127.0.0.1", 0)
+    supervisor_server = await websockets.serve(ws_server.ws_server.supervisor_handler, "127.0.0.1", 0)
+    ports = tuple(server.sockets[0].getsockname()[1] for server in (http_server, agent_server, supervisor_server))
+
+    print(f"{args.callers} callers, {args.supervisors} supervisors, {args.duration:.0f}s per run, "
+          f"{args.unknown_rate:.0%} unknown questions, seed {args.seed}")
+    print(f"{'entries':>8} {'replies/s':>10} {'answer p50/p99 ms':>18} {'escalate p50/p99 ms':>20} "
+          f"{'supervisor p50/p99 ms':>22} {'rss MB':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for entries in args.entries:
+            r = await run_scenario(entries, args, ports, tmp)
+            print(f"{r['entries']:>8} {r['replies_per_sec']:>10.0f} "
+                  f"{ms(r['answer'], 50):>8.1f}/{ms(r['answer'], 99):<9.1f} "
+                  f"{ms(r['escalation'], 50):>9.1f}/{ms(r['escalation'], 99):<10.1f} "
+                  f"{ms(r['supervisor'], 50):>10.1f}/{ms(r['supervisor'], 99):<11.1f} "
+                  f"{r['rss_before']:>6.0f} -> {r['rss_after']:<6.0f}")
+            problems = {k: r[k] for k in ("errors", "timeouts", "unanswered_escalations") if r[k]}
+            if problems:
+                print(f"{'':>8} {problems}")
+
+    for server in (http_server, agent_server, supervisor_server):
+        server.close()
+    await asyncio.sleep(0.2)  # let closed keep-alive connections finish before the loop goes away
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--supervisors", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per knowledge base size")
+    parser.add_argument("--unknown-rate", type=float, default=0.05, help="share of questions the KB can't answer")
+    parser.add_argument("--unknown-questions", type=int, default=50, help="distinct unknown questions")
+    parser.add_argument("--think", type=float, default=0, help="seconds a caller waits between questions")
+    parser.add_argument("--supervisor-delay", type=float, default=0.2, help="seconds a supervisor takes to answer")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
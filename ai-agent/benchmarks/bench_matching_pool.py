@@ -0,0 +1,95 @@
+"""Throughput of knowledge base matching inline vs. in the process pool.
+
+Writes a synthetic knowledge base to a temporary file, then matches the same
+batch of questions inline on one core and through MatchingPool with 1, 2, 4...
+workers up to --workers, printing questions/sec and the speed-up over inline.
+Run from the ai-agent directory:
+
+    python benchmarks/bench_matching_pool.py --entries 50000 --queries 4000 --mode ranked
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kb_store import KnowledgeBaseStore
+from match_pool import MatchingPool
+
+WORDS = ("hair cut color price booking weekend open close nails spa facial massage "
+         "appointment cancel parking gift card student discount bridal wax brow lash "
+         "style trim keratin perm highlight balayage manicure pedicure hours staff").split()
+
+
+def synthetic_kb(entries, rng):
+    return [{
+        "id": str(i),
+        "question": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + f" item{i}",
+        "answer": f"answer {i}"
+    } for i in range(entries)]
+
+
+def synthetic_queries(count, rng):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))) for _ in range(count)]
+
+
+def time_inline(store, queries, mode, min_score):
+    snapshot = store.snapshot()
+    start = time.perf_counter()
+    for query in queries:
+        snapshot.answer(query, mode, min_score)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def time_pool(store, queries, workers, mode, min_score, chunk_size):
+    pool = MatchingPool(store, workers, mode, min_score)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pool.start()
+    try:
+        start = time.perf_counter()
+        asyncio.run(pool.match_many(queries, chunk_size))
+        return len(queries) / (time.perf_counter() - start)
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=4000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="largest pool to try")
+    parser.add_argument("--mode", choices=("first", "ranked"), default="ranked")
+    parser.add_argument("--min-score", type=float, default=0.35)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "knowledge_base.json")
+        with open(path, "w") as f:
+            json.dump(synthetic_kb(args.entries, rng), f)
+        queries = synthetic_queries(args.queries, rng)
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            store = KnowledgeBaseStore(path)
+            store.snapshot()
+        if args.mode == "ranked":
+            store.current.ranker
+
+        print(f"{args.entries} entries, {args.queries} queries, {args.mode} mode, {os.cpu_count()} CPUs")
+        inline = time_inline(store, queries, args.mode, args.min_score)
+        print(f"inline     {inline:10.0f} q/s")
+        sizes = sorted({1 << i for i in range(args.workers.bit_length()) if 1 << i <= args.workers} | {args.workers})
+        for workers in sizes:
+            rate = time_pool(store, queries, workers, args.mode, args.min_score, args.chunk_size)
+            print(f"{workers:2d} workers {rate:10.0f} q/s  {rate / inline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import json
+import uuid
+
+# message types the agent sends to callers
+WELCOME = "welcome"
+ANSWER = "answer"
+ESCALATION = "escalation"
+SUPERVISOR_ANSWER = "supervisor_answer"
+ERROR = "error"
+
+
+def encode(message_type, message, request_id=None, correlation_id=None):
+    """Serialize an agent -> caller message"""
+    return json.dumps({
+        "type": message_type,
+        "message": message,
+        "request_id": request_id,
+        "correlation_id": correlation_id
+    }).encode('utf-8')
+
+
+def decode(data_bytes):
+    """Parse a message from either side into a dict with at least "message".
+
+    Callers may send a JSON envelope ({"message": ..., "correlation_id": ...})
+    or plain text; plain text gets a fresh correlation id.
+    """
+    text = data_bytes.decode('utf-8')
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get("message"), str):
+            data.setdefault("correlation_id", None)
+            if not data["correlation_id"]:
+                data["correlation_id"] = uuid.uuid4().hex
+            return data
+    return {"message": text, "correlation_id": uuid.uuid4().hex}
@@ -0,0 +1,229 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
+from normalize import normalize_question
+
+HELP_REQUEST_URL = "http://localhost:5000/api/v1/helpreq"
+
+# responses worth retrying: the backend or a proxy in front of it is overloaded
+RETRY_STATUSES = {502, 503, 504}
+
+
+escalation_rtt = registry.histogram("escalation_rtt_seconds", "Round trip of one help request POST to the backend")
+escalation_attempts = {outcome: registry.counter("escalation_attempts_total", "Help request POSTs, by outcome",
+                                                 outcome=outcome)
+                       for outcome in ("ok", "retryable", "error")}
+
+
+class EscalationError(Exception):
+    """Raised when a help request could not be delivered after all retries"""
+
+
+class EscalationClient:
+    """Posts help requests to the backend without blocking the event loop.
+
+    Requests go through one keep-alive requests.Session whose connection pool
+    is sized to the in-flight limit, and run on a small dedicated thread pool.
+    The asyncio semaphore caps how many escalations are in flight, so a slow
+    backend queues escalations instead of piling up threads and sockets.
+    requests is only imported when the first escalation is sent.
+    """
+
+    def __init__(self, url=HELP_REQUEST_URL, max_in_flight=8, timeout=(2.0, 5.0),
+                 retries=2, backoff=0.25, agent_id=None):
+        self.url = url
+        self.agent_id = agent_id  # sent with each request so updates come back to this agent only
+        self.timeout = timeout  # (connect, read) seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.max_in_flight = max_in_flight
+
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight,
+                                            thread_name_prefix="escalation")
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def session(self):
+        """The keep-alive session, created on first use"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    async def submit(self, question, caller_id=None, request_id=None):
+        """Create a help request, returning the backend's response"""
+        payload = {"question": question}
+        if caller_id is not None:
+            payload["caller_id"] = caller_id
+        if request_id is not None:
+            payload["request_id"] = request_id
+        if self.agent_id is not None:
+            payload["agent_id"] = self.agent_id
+        return await self.post_json(self.url, payload)
+
+    async def post_json(self, url, payload):
+        """POST payload with bounded retries and jittered exponential backoff"""
+        import requests
+        loop = asyncio.get_running_loop()
+        self.session  # create it here rather than racing to in the worker threads
+        async with self._slots:
+            for attempt in range(self.retries + 1):
+                start = time.perf_counter()
+                try:
+                    res = await loop.run_in_executor(self._executor, self._post, url, payload)
+                    escalation_rtt.record(time.perf_counter() - start)
+                    if 200 <= res.status_code < 300:
+                        escalation_attempts["ok"].inc()
+                        return res
+                    if res.status_code not in RETRY_STATUSES:
+                        # the backend refused it (400, 500, ...); resending won't help, the caller checks the status
+                        escalation_attempts["error"].inc()
+                        return res
+                    escalation_attempts["retryable"].inc()
+                    error = f"HTTP {res.status_code}"
+                except requests.ConnectionError as e:
+                    # the request never reached the backend, so resending cannot duplicate it;
+                    # read timeouts are not retried because the request may have been created
+                    escalation_attempts["retryable"].inc()
+                    error = e
+                except requests.RequestException as e:
+                    escalation_attempts["error"].inc()
+                    raise EscalationError(str(e)) from e
+
+                if attempt < self.retries:
+                    delay = self.backoff * (2 ** attempt)
+                    await asyncio.sleep(delay * (0.5 + random.random()))
+
+        raise EscalationError(f"giving up after {self.retries + 1} attempts: {error}")
+
+    def _post(self, url, payload):
+        return self.session.post(url, json=payload, timeout=self.timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+class EscalationGroup:
+    """One help request shared by every caller who asked the same question"""
+
+    def __init__(self, key, question, request_id):
+        self.key = key
+        self.question = question
+        self.request_id = request_id
+        self.callers = []
+        self.submitted = asyncio.get_running_loop().create_future()  # resolves to the backend id
+
+    def payload(self, agent_id=None):
+        payload = {
+            "question": self.question,
+            "caller_ids": list(self.callers),
+            "request_id": self.request_id
+        }
+        if self.callers:
+            payload["caller_id"] = self.callers[0]
+        if agent_id is not None:
+            payload["agent_id"] = agent_id
+        return payload
+
+
+class EscalationCoalescer:
+    """Collects escalations for a short window and submits them as one batch.
+
+    Escalations whose normalized question matches one already waiting in the
+    current window join that group instead of becoming a second help request;
+    the group keeps the list of callers so the supervisor's answer can be sent
+    to each of them.
+    """
+
+    def __init__(self, client, url=None, window=0.05, max_batch=50):
+        self.client = client
+        self.url = url or client.url + "/batch"  # next to the client's single-request endpoint
+        self.window = window
+        self.max_batch = max_batch
+        self._groups = {}  # normalized question -> EscalationGroup waiting to be sent
+        self._flush_task = None
+
+    def add(self, question, caller_id, request_id):
+        """Queue an escalation and return the group it belongs to"""
+        key = normalize_question(question)
+        group = self._groups.get(key)
+        if group is None:
+            group = EscalationGroup(key, question, request_id)
+            self._groups[key] = group
+        group.callers.append(caller_id)
+
+        if len(self._groups) >= self.max_batch:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            asyncio.create_task(self._send(self._take()))
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return group
+
+    def _take(self):
+        groups = list(self._groups.values())
+        self._groups = {}
+        return groups
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        await self._send(self._take())
+
+    async def _send(self, batch):
+        if not batch:
+            return
+        try:
+            ids = await self._submit(batch)
+            for group, backend_id in zip(batch, ids):
+                group.submitted.set_result(backend_id)
+        except Exception as e:
+            error = e if isinstance(e, EscalationError) else EscalationError(f"batch escalation failed: {e!r}")
+            for group in batch:
+                if not group.submitted.done():
+                    group.submitted.set_exception(error)
+        finally:
+            # callers await these futures, so none may be left pending (e.g. on cancellation)
+            for group in batch:
+                if not group.submitted.done():
+                    group.submitted.set_exception(EscalationError("batch escalation was cancelled"))
+
+    async def _submit(self, batch):
+        agent_id = self.client.agent_id
+        res = await self.client.post_json(self.url, [group.payload(agent_id) for group in batch])
+        try:
+            if res.status_code == 404:
+                # backend without the batch endpoint, fall back to one request each
+                results = await asyncio.gather(*[
+                    self.client.post_json(self.client.url, group.payload(agent_id)) for group in batch
+                ])
+                return [_created_id(r, group) for r, group in zip(results, batch)]
+            if res.status_code != 201:
+                raise EscalationError(f"batch escalation failed: HTTP {res.status_code}")
+            items = res.json()
+            if not isinstance(items, list):
+                raise EscalationError(f"batch escalation answered with a {type(items).__name__}, not a list")
+            if len(items) != len(batch):
+                raise EscalationError(f"batch escalation answered {len(items)} of {len(batch)} requests")
+            return [(item.get("id") if isinstance(item, dict) else None) or group.request_id
+                    for item, group in zip(items, batch)]
+        except ValueError as e:
+            raise EscalationError(f"unreadable escalation response: {e}") from e
+
+
+def _created_id(res, group):
+    if res.status_code != 201:
+        raise EscalationError(f"escalation failed: HTTP {res.status_code}")
+    return res.json().get("id") or group.request_id
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from metrics import registry
+
+DEFAULT_QUEUE_SIZE = 256
+# what happens when a subscriber's queue is full
+DISCONNECT = "disconnect"    # close the connection, the agent reconnects and resyncs
+DROP_OLDEST = "drop_oldest"  # keep the connection, lose its oldest queued message
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "try again later"
+
+send_seconds = registry.histogram("ws_send_seconds", "Time to hand one message to an agent socket")
+publish_seconds = registry.histogram("ws_publish_seconds", "Time to serialize a message and queue it for every agent")
+published = registry.counter("ws_published_total", "Messages published to agents")
+queued = registry.counter("ws_queued_total", "Messages queued for an agent connection, one per recipient")
+
+
+class Subscriber:
+    """One connection's outbound queue, drained by its own sender task.
+
+    A stalled socket only backs up its own queue; once that holds queue_size
+    messages the subscriber is disconnected or starts dropping, depending on
+    on_overflow.
+
+    A subscriber created with hold=True keeps published messages aside until
+    release(), so a replay queued in between (with force) goes out first.
+    """
+
+    def __init__(self, websocket, agent_id=None, queue_size=DEFAULT_QUEUE_SIZE, on_overflow=DISCONNECT, hold=False):
+        self.websocket = websocket
+        self.agent_id = agent_id  # set from the agent's hello; None receives every message
+        self.queue_size = queue_size
+        self.on_overflow = on_overflow
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.too_slow = False  # disconnected because its queue overflowed
+        self._queue = deque()
+        self.held = [] if hold else None  # (message, owner, replayable) published before release()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._send_loop())
+
+    def wants(self, owner):
+        """Whether a message for the given owning agent (None: everyone) goes to this subscriber"""
+        return owner is None or self.agent_id is None or self.agent_id == owner
+
+    def enqueue(self, message, force=False):
+        """Queue an already serialized message; force skips the bound (for replays)"""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.queue_size and not force:
+            if self.on_overflow != DROP_OLDEST:
+                print(f"Disconnecting slow agent {self.agent_id or self.websocket.remote_address}: "
+                      f"{len(self._queue)} messages waiting")
+                self.too_slow = True
+                self.close(SLOW_CONSUMER_CLOSE_CODE, "too slow")
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(message)
+        self._wakeup.set()
+        return True
+
+    def hold(self, message, owner, replayable):
+        if len(self.held) >= self.queue_size:
+            self.held.pop(0)
+            self.dropped += 1
+        self.held.append((message, owner, replayable))
+
+    def release(self, replayed=False):
+        """Start taking published messages; with replayed, drop the held ones a replay already covered"""
+        held, self.held = self.held, None
+        for message, owner, replayable in held or ():
+            if not (replayed and replayable) and self.wants(owner):
+                self.enqueue(message)
+
+    async def _send_loop(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            message = self._queue.popleft()
+            start = time.perf_counter()
+            try:
+                await self.websocket.send(message)
+                send_seconds.record(time.perf_counter() - start)
+            except Exception as e:
+                # the handler's receive loop sees the same failure and unsubscribes us
+                print(f"Error sending to agent: {e}")
+                self.close()
+                return
+            self.sent += 1
+
+    def close(self, code=None, reason=""):
+        """Stop sending; with a code, also close the connection"""
+        if self.closed:
+            return
+        self.closed = True
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self.websocket.close(code, reason))
+
+
+class FanOut:
+    """Delivers each message to many connections, serialized once.
+
+    publish() is synchronous: it only appends to the subscribers' queues, so
+    one slow or failing connection cannot delay or fail delivery to the rest,
+    and messages published in order are sent to each connection in order.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, on_overflow=DISCONNECT):
+        self.queue_size = queue_size
+        self.on_overflow = on_overflow
+        self.subscribers = {}  # websocket -> Subscriber
+        self.disconnected_slow = 0
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, websocket, agent_id=None, hold=False):
+        subscriber = Subscriber(websocket, agent_id, self.queue_size, self.on_overflow, hold)
+        self.subscribers[websocket] = subscriber
+        return subscriber
+
+    def unsubscribe(self, websocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is not None:
+            if subscriber.too_slow:
+                self.disconnected_slow += 1
+            subscriber.close()
+
+    def publish(self, data, owner=None):
+        """Queue data for every subscriber (only owner's, if given); returns how many took it"""
+        start = time.perf_counter()
+        message = json.dumps(data)
+        replayable = 'version' in data  # numbered by a ReplayLog, so a resuming client gets it replayed
+        delivered = 0
+        for subscriber in list(self.subscribers.values()):
+            if subscriber.held is not None:
+                subscriber.hold(message, owner, replayable)
+                delivered += 1
+            elif subscriber.wants(owner) and subscriber.enqueue(message):
+                delivered += 1
+        publish_seconds.record(time.perf_counter() - start)
+        published.inc()
+        queued.inc(delivered)
+        return delivered
+
+    def stats(self):
+        subscribers = list(self.subscribers.values())
+        return {
+            'subscribers': len(subscribers),
+            'queued': sum(len(s._queue) for s in subscribers),
+            'dropped': sum(s.dropped for s in subscribers),
+            'disconnected_slow': self.disconnected_slow
+        }
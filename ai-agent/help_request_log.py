@@ -0,0 +1,226 @@
+import json
+import os
+from json.decoder import scanstring
+import queue
+import threading
+import time
+
+DEFAULT_MAX_BATCH = 4096  # operations written (and fsynced) together at most
+COMPACT_MIN_LINES = 100000
+COMPACT_RATIO = 4  # compact once the log holds this many lines per live request
+
+_CLOSE = object()
+
+
+class HelpRequestLog:
+    """Append-only journal that makes a HelpRequestStore survive restarts.
+
+    The store hands every add, update and removal to record() on the event
+    loop; that only queues the operation. A writer thread appends whatever has
+    queued up as one batch of JSON lines and fsyncs once per batch (group
+    commit), so request handlers never wait on the disk. The price is that a
+    crash can lose the last few milliseconds of changes.
+
+    open() replays the log into the store, keeping only the requests still
+    alive at the end, and rewrites the log as just those requests when it has
+    grown much larger than that. compact() does the same while running.
+    """
+
+    def __init__(self, path, fsync=True, max_batch=DEFAULT_MAX_BATCH):
+        self.path = path
+        self.fsync = fsync
+        self.max_batch = max_batch
+        self.lines = 0       # lines in the log file, as of the last batch written
+        self.written = 0     # operations written since open()
+        self.batches = 0
+        self.failed = 0      # operations lost to write errors
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = None
+        self._compacting = False
+
+    def open(self, store):
+        """Replay the log into store, compact it if worthwhile, and start journaling store's changes"""
+        start = time.perf_counter()
+        records, lines, end = self._replay()
+        if end is not None:
+            # drop the torn tail so new lines don't follow it
+            os.truncate(self.path, end)
+        for request_id, record in records.items():
+            try:
+                store.restore(request_id, record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping unreadable help request {request_id} in the log: {e!r}")
+        evicted = store.prune()
+        self.lines = lines
+        print(f"Recovered {len(store)} help requests from {lines} log lines "
+              f"in {time.perf_counter() - start:.2f}s ({evicted} expired)")
+
+        if lines > COMPACT_MIN_LINES and lines > COMPACT_RATIO * len(store):
+            self._rewrite(list(store.as_dict().items()))
+        else:
+            self._file = open(self.path, 'ab')
+        store.journal = self
+        self._thread = threading.Thread(target=self._write_loop, name="help-request-log", daemon=True)
+        self._thread.start()
+        return self
+
+    def _replay(self):
+        """Requests alive at the end of the log, its line count, and where a torn tail starts"""
+        # most logged requests have been removed by the end, so only the op and id are
+        # parsed on the way through and just the surviving requests' lines in full
+        lines_by_id = {}
+        lines = 0
+        offset = 0
+        torn = None
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return {}, 0, None
+        with f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # only the last line can lack one: a crash in the middle of a write,
+                    # nothing after it was acknowledged as durable
+                    print(f"Help request log ends in a partial line after {lines} lines")
+                    torn = offset
+                    break
+                lines += 1
+                offset += len(line)
+                try:
+                    kind, request_id = _op_and_id(line.decode('utf-8'))
+                except ValueError:
+                    kind, request_id = _parse_op_and_id(line)
+                    if kind is None:
+                        # a complete line we can't read; skip it rather than lose everything after it
+                        print(f"Skipping unreadable help request log line {lines}: {line[:80]!r}")
+                        continue
+                if kind == 'add':
+                    # a re-added id counts as created now, like HelpRequestStore.add
+                    lines_by_id.pop(request_id, None)
+                    lines_by_id[request_id] = [line]
+                elif kind == 'update':
+                    pending = lines_by_id.get(request_id)
+                    if pending is not None:
+                        pending.append(line)
+                else:
+                    lines_by_id.pop(request_id, None)
+
+        records = {}
+        for request_id, pending in lines_by_id.items():
+            try:
+                record = json.loads(pending[0])[2]
+                for line in pending[1:]:
+                    record.update(json.loads(line)[2])
+            except (ValueError, IndexError, TypeError) as e:
+                print(f"Skipping unreadable help request {request_id} in the log: {e}")
+                continue
+            records[request_id] = record
+        return records, lines, torn
+
+    def record(self, kind, request_id, fields=None):
+        """Queue one store operation; fields must not be changed afterwards"""
+        self._queue.put((kind, request_id) if fields is None else (kind, request_id, fields))
+
+    def compact(self, store):
+        """Rewrite the log as the store's current requests if it has grown too large"""
+        if self._compacting or self.lines <= COMPACT_MIN_LINES or self.lines <= COMPACT_RATIO * len(store):
+            return False
+        # copied here so the writer thread never reads records the event loop is changing
+        self._compacting = True
+        self._queue.put(('compact', [(request_id, dict(record)) for request_id, record in store.as_dict().items()]))
+        return True
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            ops = []
+            for op in batch:
+                if op is _CLOSE or op[0] == 'compact':
+                    self._write(ops)
+                    ops = []
+                    if op is _CLOSE:
+                        self._file.close()
+                        return
+                    self._rewrite(op[1])
+                    self._compacting = False
+                else:
+                    ops.append(op)
+            self._write(ops)
+
+    def _write(self, ops):
+        if not ops:
+            return
+        data = b''.join(json.dumps(op, separators=(',', ':')).encode('utf-8') + b'\n' for op in ops)
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            self.failed += len(ops)
+            print(f"Error writing help request log: {e}")
+            return
+        self.lines += len(ops)
+        self.written += len(ops)
+        self.batches += 1
+
+    def _rewrite(self, items):
+        """Replace the log with one add line per request, atomically"""
+        tmp_path = self.path + '.compact'
+        try:
+            with open(tmp_path, 'wb') as f:
+                for request_id, record in items:
+                    f.write(json.dumps(['add', request_id, record], separators=(',', ':')).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error compacting help request log: {e}")
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            return
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'ab')
+        print(f"Compacted help request log from {self.lines} to {len(items)} lines")
+        self.lines = len(items)
+
+    def close(self):
+        """Write out everything queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'lines': self.lines, 'written': self.written, 'batches': self.batches,
+                'queued': self._queue.qsize(), 'failed': self.failed}
+
+
+def _op_and_id(text):
+    """The first two items of a log line, ["op","id",...], without parsing the rest"""
+    if not text.startswith('["'):
+        raise ValueError("not a log line")
+    kind, end = scanstring(text, 2)
+    if text[end:end + 2] != ',"':
+        raise ValueError("not a log line")
+    request_id, end = scanstring(text, end + 2)
+    return kind, request_id
+
+
+def _parse_op_and_id(line):
+    """Op and id of a line _op_and_id can't take (e.g. a non-string id from older versions), or (None, None)"""
+    try:
+        op = json.loads(line)
+    except ValueError:
+        return None, None
+    if not isinstance(op, list) or len(op) < 2 or not isinstance(op[0], str) or op[1] is None:
+        return None, None
+    return op[0], str(op[1])
@@ -0,0 +1,252 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# matches the backend, which gives up on help requests after 24 hours
+DEFAULT_RETENTION = 24 * 60 * 60
+DEFAULT_MAX_RECORDS = 100000
+
+
+class HelpRequestStore:
+    """In-memory help requests, indexed for cheap dashboard polls.
+
+    Every create or update takes the next sequence number. Records are
+    indexed by creation sequence (globally, per status and per caller) for
+    newest-first cursor pagination, and kept in change order so a poll with a
+    `since` watermark only walks the rows that changed after it.
+
+    Requests older than `retention` seconds, and the oldest requests beyond
+    `max_records`, are evicted as new ones arrive and on prune().
+
+    With a journal (HelpRequestLog) attached, every change is also handed to
+    it to be written to disk in the background.
+    """
+
+    def __init__(self, retention=DEFAULT_RETENTION, max_records=DEFAULT_MAX_RECORDS):
+        self.retention = retention
+        self.max_records = max_records
+        self.evictions = Counter()     # reason -> number of requests evicted
+        self._records = {}             # request_id -> record
+        self._created = {}             # request_id -> creation sequence
+        self._ids_by_seq = {}          # creation sequence -> request_id
+        self._created_seqs = []        # creation sequences, ascending
+        self._created_times = []       # creation timestamps, parallel to _created_seqs
+        self._by_status = {}           # status -> ascending creation sequences
+        self._by_caller = {}           # caller_id -> ascending creation sequences
+        self._changes = OrderedDict()  # request_id -> change sequence, latest last
+        self._seq = 0
+        self.journal = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, request_id):
+        return request_id in self._records
+
+    def get(self, request_id):
+        return self._records.get(request_id)
+
+    @property
+    def watermark(self):
+        return self._seq
+
+    def add(self, request_id, question, caller_id, status='pending', **fields):
+        """Create (or replace) a help request and return its record"""
+        if request_id in self._records:
+            self.remove(request_id)
+
+        now = datetime.now()
+        record = {
+            'question': question,
+            'caller_id': caller_id,
+            'status': status,
+            'created_at': now.isoformat()
+        }
+        record.update(fields)
+        self._insert(request_id, record, now.timestamp())
+        if self.journal is not None:
+            self.journal.record('add', request_id, dict(record))
+        self.prune()
+        return record
+
+    def restore(self, request_id, record):
+        """Put back a request read from the journal, keeping its creation time.
+
+        Requests must be restored in the order they were created.
+        """
+        self._insert(request_id, record, datetime.fromisoformat(record['created_at']).timestamp())
+
+    def _insert(self, request_id, record, created_time):
+        self._seq += 1
+        self._records[request_id] = record
+        self._created[request_id] = self._seq
+        self._ids_by_seq[self._seq] = request_id
+        self._created_seqs.append(self._seq)
+        self._created_times.append(created_time)
+        self._by_status.setdefault(record['status'], []).append(self._seq)
+        self._by_caller.setdefault(record['caller_id'], []).append(self._seq)
+        self._changes[request_id] = self._seq
+
+    def update(self, request_id, **fields):
+        """Change fields of an existing request, returning the record or None"""
+        record = self._records.get(request_id)
+        if record is None:
+            return None
+
+        created = self._created[request_id]
+        status = fields.get('status', record['status'])
+        if status != record['status']:
+            _discard(self._by_status[record['status']], created)
+            insort(self._by_status.setdefault(status, []), created)
+        record.update(fields)
+        if self.journal is not None:
+            self.journal.record('update', request_id, dict(fields))
+
+        self._seq += 1
+        self._changes[request_id] = self._seq
+        self._changes.move_to_end(request_id)
+        return record
+
+    def remove(self, request_id):
+        record = self._records.pop(request_id, None)
+        if record is None:
+            return None
+        created = self._created.pop(request_id)
+        del self._ids_by_seq[created]
+        position = bisect_left(self._created_seqs, created)
+        del self._created_seqs[position]
+        del self._created_times[position]
+        _discard(self._by_status[record['status']], created)
+        _discard(self._by_caller[record['caller_id']], created)
+        if not self._by_caller[record['caller_id']]:
+            del self._by_caller[record['caller_id']]
+        del self._changes[request_id]
+        if self.journal is not None:
+            self.journal.record('remove', request_id)
+        return record
+
+    def prune(self, now=None):
+        """Evict expired requests, then the oldest ones while over max_records"""
+        expired_before = (time.time() if now is None else now) - self.retention
+        evicted = Counter()
+        while self._created_seqs:
+            if self._created_times[0] < expired_before:
+                reason = 'expired'
+            elif len(self._records) > self.max_records:
+                reason = 'size'
+            else:
+                break
+            self.remove(self._ids_by_seq[self._created_seqs[0]])
+            evicted[reason] += 1
+        if evicted:
+            self.evictions.update(evicted)
+        return sum(evicted.values())
+
+    def stats(self):
+        statuses = {status: len(seqs) for status, seqs in self._by_status.items() if seqs}
+        return {
+            'requests': len(self._records),
+            'by_status': statuses,
+            'watermark': self._seq,
+            'evictions': dict(self.evictions)
+        }
+
+    def as_dict(self):
+        """Every request keyed by id, the original unfiltered GET response"""
+        return self._records
+
+    def query(self, status=None, caller_id=None, created_after=None, created_before=None,
+              cursor=None, since=None, limit=DEFAULT_PAGE_SIZE):
+        """Return a page of matching requests.
+
+        With `since`, returns requests created or updated after that watermark
+        in change order, plus the watermark to send next time. Otherwise returns
+        requests newest first, with a cursor for the next (older) page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if since is not None:
+            return self._changes_since(int(since), status, caller_id, created_after, created_before, limit)
+
+        candidates = self._created_seqs
+        if status is not None:
+            candidates = self._by_status.get(status, [])
+        if caller_id is not None:
+            by_caller = self._by_caller.get(caller_id, [])
+            if status is None or len(by_caller) < len(candidates):
+                candidates = by_caller
+
+        # time range and cursor both narrow the sequence range [low, high)
+        low, high = 0, len(candidates)
+        if created_after is not None:
+            first = bisect_left(self._created_times, _timestamp(created_after))
+            if first < len(self._created_seqs):
+                low = bisect_left(candidates, self._created_seqs[first])
+            else:
+                low = high
+        if created_before is not None:
+            last = bisect_right(self._created_times, _timestamp(created_before))
+            high = bisect_left(candidates, self._created_seqs[last]) if last < len(self._created_seqs) else high
+        if cursor is not None:
+            high = min(high, bisect_left(candidates, int(cursor)))
+
+        items = []
+        position = high
+        while position > low and len(items) < limit:
+            position -= 1
+            request_id = self._ids_by_seq[candidates[position]]
+            record = self._records[request_id]
+            if status is not None and record['status'] != status:
+                continue
+            if caller_id is not None and record['caller_id'] != caller_id:
+                continue
+            items.append(dict(record, request_id=request_id))
+
+        next_cursor = candidates[position] if position > low else None
+        return {'items': items, 'next_cursor': next_cursor, 'watermark': self._seq}
+
+    def _changes_since(self, since, status, caller_id, created_after, created_before, limit):
+        changed = []
+        for request_id in reversed(self._changes):
+            if self._changes[request_id] <= since:
+                break
+            changed.append(request_id)
+        changed.reverse()
+
+        after = _timestamp(created_after) if created_after is not None else None
+        before = _timestamp(created_before) if created_before is not None else None
+        items = []
+        watermark = since
+        for request_id in changed:
+            if len(items) == limit:
+                break
+            watermark = self._changes[request_id]
+            record = self._records[request_id]
+            if status is not None and record['status'] != status:
+                continue
+            if caller_id is not None and record['caller_id'] != caller_id:
+                continue
+            if after is not None or before is not None:
+                created_at = datetime.fromisoformat(record['created_at']).timestamp()
+                if (after is not None and created_at < after) or (before is not None and created_at > before):
+                    continue
+            items.append(dict(record, request_id=request_id))
+
+        if len(items) < limit:
+            watermark = self._seq
+        return {'items': items, 'next_cursor': None, 'watermark': watermark}
+
+
+def _discard(sequences, seq):
+    position = bisect_left(sequences, seq)
+    if position < len(sequences) and sequences[position] == seq:
+        del sequences[position]
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,181 @@
+import asyncio
+import json
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15.0  # seconds an idle keep-alive connection is held open
+REQUEST_TIMEOUT = 30.0  # seconds to send the headers and body once the request line is in
+MAX_KEEP_ALIVE_REQUESTS = 1000
+
+
+class HTTPError(Exception):
+    """Raised by handlers (or the parser) to answer with an error status"""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+        self.message = message or HTTPStatus(status).phrase
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body', 'remote')
+
+    def __init__(self, method, target, headers, body, remote):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+        self.remote = remote
+
+    def json(self):
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, "Invalid JSON body")
+
+
+class HTTPServer:
+    """Small HTTP/1.1 server that runs on the caller's asyncio loop.
+
+    Handlers are coroutines taking a Request and returning (status, body),
+    where body is JSON-serialisable, or (status, text, content_type). Keep-alive
+    is on by default, header and body sizes are capped, and requests on one
+    connection are answered in order.
+    """
+
+    def __init__(self, name="HTTP", max_body_bytes=MAX_BODY_BYTES, log_requests=True):
+        self.name = name
+        self.max_body_bytes = max_body_bytes
+        self.log_requests = log_requests
+        self.routes = {}
+
+    def route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+    async def _handle_connection(self, reader, writer):
+        remote = writer.get_extra_info('peername')
+        remote = remote[0] if remote else "-"
+        try:
+            for _ in range(MAX_KEEP_ALIVE_REQUESTS):
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, ValueError):
+                    # idle past the keep-alive timeout, or a request line over the size limit
+                    break
+                if not request_line.strip():
+                    break
+
+                method = target = "-"
+                keep_alive = False
+                try:
+                    # one deadline for the whole request, so a slow sender can't hold the connection open
+                    deadline = asyncio.get_running_loop().time() + REQUEST_TIMEOUT
+                    method, target, version, headers = await _before(deadline, self._read_head(request_line, reader))
+                    keep_alive = _wants_keep_alive(version, headers)
+                    body = await _before(deadline, self._read_body(headers, reader))
+                    request = Request(method, target, headers, body, remote)
+                    status, content, content_type = await self._dispatch(request)
+                except HTTPError as e:
+                    status, content, content_type = e.status, json.dumps({'error': e.message}).encode('utf-8'), 'application/json'
+                    # the rest of the stream can't be trusted after a malformed request
+                    keep_alive = keep_alive and e.status < 500 and e.status not in (400, 408, 411, 413, 431)
+
+                writer.write(_response_head(status, content_type, len(content), keep_alive) + content)
+                await writer.drain()
+                if self.log_requests:
+                    print(f"[{self.name}] {remote} - \"{method} {target}\" {status} -")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_head(self, request_line, reader):
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        size = len(request_line)
+        while True:
+            try:
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                raise HTTPError(431)
+            size += len(line)
+            if size > MAX_HEADER_BYTES:
+                raise HTTPError(431)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def _read_body(self, headers, reader):
+        if 'transfer-encoding' in headers:
+            raise HTTPError(411, "Chunked request bodies are not supported, send Content-Length")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise HTTPError(413, f"Request body larger than {self.max_body_bytes} bytes")
+        return await reader.readexactly(length) if length > 0 else b''
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                raise HTTPError(405)
+            raise HTTPError(404)
+        try:
+            result = await handler(request)
+        except HTTPError:
+            raise
+        except Exception as e:
+            print(f"Error handling {request.method} {request.path}: {e}")
+            import traceback
+            traceback.print_exc()
+            raise HTTPError(500)
+
+        if len(result) == 3:
+            status, text, content_type = result
+            return status, text.encode('utf-8'), content_type
+        status, body = result
+        return status, json.dumps(body).encode('utf-8'), 'application/json'
+
+
+async def _before(deadline, read):
+    """Await read, answering 408 if it isn't done by deadline (loop time)"""
+    try:
+        return await asyncio.wait_for(read, max(deadline - asyncio.get_running_loop().time(), 0))
+    except asyncio.TimeoutError:
+        raise HTTPError(408, "Timed out reading the request")
+
+
+def _wants_keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+def _response_head(status, content_type, length, keep_alive):
+    return (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {length}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode('latin-1')
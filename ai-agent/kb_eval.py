@@ -0,0 +1,268 @@
+"""Replay caller questions through the knowledge base matcher offline.
+
+Streams a JSONL file of questions through the same matching find_answer
+uses, a chunk at a time, so memory stays bounded however long the file is.
+Each line is either a JSON string or an object with a "question" (or
+"message" / "text") field and, optionally, the "expected" answer.
+
+    python kb_eval.py questions.jsonl --out decisions.jsonl
+
+reports the hit rate (answered), escalation rate and matcher throughput.
+Giving a baseline as well runs every question through both and reports what
+changed, which makes a KB edit or a matcher switch reviewable before it ships:
+
+    python kb_eval.py questions.jsonl --kb new.json --baseline-kb knowledge_base.json \\
+        --max-coverage-drop 0.5 --max-slowdown 1.2
+
+exits with status 1 when the candidate answers noticeably fewer questions or
+matches noticeably slower than the baseline.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+from kb_store import KnowledgeBaseSnapshot, KnowledgeBaseStore
+
+DEFAULT_CHUNK_SIZE = 1024
+DEFAULT_MIN_SCORE = 0.35  # agent.RANKED_MIN_SCORE without config.py
+
+
+class Matcher:
+    """One knowledge base and matcher mode, with its running totals"""
+
+    def __init__(self, kb_path, mode="first", min_score=DEFAULT_MIN_SCORE, snapshot_path=None):
+        self.kb_path = kb_path
+        self.mode = mode
+        self.min_score = min_score
+        self.snapshot = _map_snapshot(kb_path, snapshot_path) if snapshot_path else None
+        if self.snapshot is None:
+            # no snapshot_path: an evaluation must never write (or replace) a production snapshot
+            store = KnowledgeBaseStore(kb_path)
+            if not store.refresh():
+                raise SystemExit(f"{kb_path}: could not load the knowledge base")
+            self.snapshot = store.current
+        if mode == "ranked":
+            self.snapshot.ranker  # built now so it isn't timed as matching
+        self.queries = 0
+        self.answered = 0
+        self.correct = 0
+        self.expected = 0
+        self.seconds = 0.0
+
+    def match_chunk(self, questions):
+        """Answer (or None) for each question, counted and timed"""
+        # repeated questions in a chunk are matched once; the answer only depends on the text
+        unique = list(dict.fromkeys(questions))
+        start = time.perf_counter()
+        if self.mode == "ranked":
+            ranked = self.snapshot.ranker.rank_many(unique, k=1, min_score=self.min_score)
+            found = {text: matches[0].answer if matches else None for text, matches in zip(unique, ranked)}
+        else:
+            match = self.snapshot.index.match
+            found = {}
+            for text in unique:
+                item = match(text)
+                found[text] = item["answer"] if item is not None else None
+        self.seconds += time.perf_counter() - start
+
+        answers = [found[text] for text in questions]
+        self.queries += len(answers)
+        self.answered += sum(1 for answer in answers if answer is not None)
+        return answers
+
+    def score(self, answer, expected):
+        if expected is not None:
+            self.expected += 1
+            if answer == expected:
+                self.correct += 1
+
+    @property
+    def hit_rate(self):
+        return self.answered / self.queries if self.queries else 0.0
+
+    @property
+    def rate(self):
+        """Questions matched per second of matching"""
+        return self.queries / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        summary = {
+            "kb": self.kb_path, "mode": self.mode, "entries": len(self.snapshot),
+            "queries": self.queries, "answered": self.answered, "escalated": self.queries - self.answered,
+            "hit_rate": round(self.hit_rate, 4), "escalation_rate": round(1 - self.hit_rate, 4) if self.queries else 0.0,
+            "match_seconds": round(self.seconds, 3), "queries_per_second": round(self.rate)
+        }
+        if self.mode == "ranked":
+            summary["min_score"] = self.min_score
+        if self.expected:
+            summary["accuracy"] = round(self.correct / self.expected, 4)
+        return summary
+
+
+def _map_snapshot(kb_path, snapshot_path):
+    """A read-only snapshot of kb_path from snapshot_path, or None if it isn't current"""
+    from kb_snapshot import SnapshotError, load_snapshot, source_digest
+    with open(kb_path, "rb") as f:
+        digest = source_digest(f.read())
+    try:
+        index = load_snapshot(snapshot_path, digest)
+    except (OSError, SnapshotError, ValueError) as e:
+        # same fallback as the store: evaluate the JSON instead
+        print(f"Not using {snapshot_path}: {e}", file=sys.stderr)
+        return None
+    return KnowledgeBaseSnapshot(None, 1, None, index)
+
+
+def read_questions(f, chunk_size):
+    """Yield lists of (line number, question, expected answer) of up to chunk_size"""
+    chunk = []
+    skipped = 0
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        expected = None
+        if isinstance(record, dict):
+            question = record.get("question", record.get("message", record.get("text")))
+            expected = record.get("expected")
+        else:
+            question = record
+        if not isinstance(question, str):
+            skipped += 1
+            if skipped <= 10:
+                print(f"Skipping line {number}: no question", file=sys.stderr)
+            continue
+        chunk.append((number, question, expected))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+    if skipped:
+        print(f"Skipped {skipped} lines without a question", file=sys.stderr)
+
+
+def _decision(answer):
+    return "answer" if answer is not None else "escalate"
+
+
+def evaluate(f, candidate, baseline=None, out=None, diff_out=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Run every question in f through candidate (and baseline); returns the diff counts"""
+    diff = {"gained": 0, "lost": 0, "changed": 0}
+    for chunk in read_questions(f, chunk_size):
+        questions = [question for _, question, _ in chunk]
+        answers = candidate.match_chunk(questions)
+        baseline_answers = baseline.match_chunk(questions) if baseline else None
+
+        lines = []
+        diff_lines = []
+        for i, (number, question, expected) in enumerate(chunk):
+            answer = answers[i]
+            candidate.score(answer, expected)
+            row = {"line": number, "question": question, "decision": _decision(answer), "answer": answer}
+            if baseline is not None:
+                baseline_answer = baseline_answers[i]
+                baseline.score(baseline_answer, expected)
+                row["baseline_decision"] = _decision(baseline_answer)
+                row["baseline_answer"] = baseline_answer
+                if answer != baseline_answer:
+                    kind = ("gained" if baseline_answer is None else
+                            "lost" if answer is None else "changed")
+                    diff[kind] += 1
+                    row["diff"] = kind
+                    if diff_out is not None:
+                        diff_lines.append(json.dumps(row))
+            if out is not None:
+                lines.append(json.dumps(row))
+        if lines:
+            out.write("\n".join(lines) + "\n")
+        if diff_lines:
+            diff_out.write("\n".join(diff_lines) + "\n")
+        if progress and candidate.queries // progress != (candidate.queries - len(chunk)) // progress:
+            print(f"{candidate.queries} questions, {candidate.hit_rate:.1%} answered", file=sys.stderr)
+    return diff
+
+
+def _open_output(path):
+    if path is None:
+        return None
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL file of caller questions through the KB matcher")
+    parser.add_argument("questions", help='JSONL file, one question (or {"question": ..., "expected": ...}) per line; - for stdin')
+    parser.add_argument("--kb", default="knowledge_base.json")
+    parser.add_argument("--kb-snapshot", help="binary snapshot (kb_snapshot.py) to map when current; never written")
+    parser.add_argument("--mode", choices=("first", "ranked"), default="first")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE, help="ranked mode escalates below this score")
+    parser.add_argument("--baseline-kb", help="compare against this knowledge base (default: --kb)")
+    parser.add_argument("--baseline-mode", choices=("first", "ranked"), help="compare against this matcher mode (default: --mode)")
+    parser.add_argument("--baseline-min-score", type=float, help="default: --min-score")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="questions matched per batch")
+    parser.add_argument("--out", help="write one decision per question as JSONL (- for stdout)")
+    parser.add_argument("--diff-out", help="write only the questions whose answer differs from the baseline")
+    parser.add_argument("--max-coverage-drop", type=float,
+                        help="fail if the hit rate drops more than this many percentage points below the baseline")
+    parser.add_argument("--max-slowdown", type=float,
+                        help="fail if matching is more than this many times slower than the baseline")
+    parser.add_argument("--progress", type=int, default=0, help="report every N questions on stderr")
+    args = parser.parse_args()
+
+    has_baseline = args.baseline_kb or args.baseline_mode or args.baseline_min_score is not None
+    if not has_baseline and (args.max_coverage_drop is not None or args.max_slowdown is not None or args.diff_out):
+        parser.error("--max-coverage-drop, --max-slowdown and --diff-out need a baseline")
+    # KnowledgeBaseStore reports loads on stdout, which may be carrying the decisions
+    with contextlib.redirect_stdout(sys.stderr):
+        candidate = Matcher(args.kb, args.mode, args.min_score, args.kb_snapshot)
+        baseline = None
+        if has_baseline:
+            baseline = Matcher(args.baseline_kb or args.kb, args.baseline_mode or args.mode,
+                               args.min_score if args.baseline_min_score is None else args.baseline_min_score)
+
+    out = _open_output(args.out)
+    diff_out = _open_output(args.diff_out)
+    # the summary goes to stderr when the decisions take stdout
+    report = sys.stderr if out is sys.stdout or diff_out is sys.stdout else sys.stdout
+    source = sys.stdin if args.questions == "-" else open(args.questions, encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        with source:
+            diff = evaluate(source, candidate, baseline, out, diff_out, args.chunk_size, args.progress)
+    finally:
+        for f in (out, diff_out):
+            if f is not None and f is not sys.stdout:
+                f.close()
+    elapsed = time.perf_counter() - start
+
+    result = {"candidate": candidate.summary(), "seconds": round(elapsed, 3)}
+    if baseline is not None:
+        result["baseline"] = baseline.summary()
+        result["diff"] = diff
+    print(json.dumps(result, indent=2), file=report)
+
+    failures = []
+    if baseline is not None and args.max_coverage_drop is not None:
+        drop = (baseline.hit_rate - candidate.hit_rate) * 100
+        if drop > args.max_coverage_drop:
+            failures.append(f"hit rate dropped {drop:.2f} points ({baseline.hit_rate:.2%} -> {candidate.hit_rate:.2%})")
+    if baseline is not None and args.max_slowdown is not None and candidate.seconds and baseline.seconds:
+        slowdown = candidate.seconds / baseline.seconds
+        if slowdown > args.max_slowdown:
+            failures.append(f"matching is {slowdown:.2f}x slower ({baseline.rate:.0f} -> {candidate.rate:.0f} questions/s)")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
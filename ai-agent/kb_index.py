@@ -0,0 +1,259 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+
+# below this many candidate ids a plain sort beats a lazy heap merge
+_EAGER_MERGE_LIMIT = 512
+
+
+class KnowledgeIndex:
+    """Token index over the knowledge base questions.
+
+    match() returns exactly the entry the original two linear scans in
+    find_answer picked: the first entry whose question is a substring of the
+    input, otherwise the first entry with at least half of its question words
+    present in the input. Both rules are answered from the input's tokens:
+
+    * substring rule: if a question occurs in the input, its inner words are
+      whole input tokens, its first word ends an input token, its last word
+      starts one and a one word question sits somewhere inside one. Each
+      question is keyed on its rarest word under the matching kind of
+      lookup, so candidates come from token, suffix, prefix and (for one
+      word questions only) substring lookups of the input tokens.
+    * overlap rule: a question with n words needs ceil(n/2) of them in the
+      input, so it must share at least one of any n//2 + 1 of its words.
+      Each question is only posted under its n//2 + 1 rarest words, which
+      keeps common words like "what" or "you" from producing huge postings.
+
+    Candidate postings are merged in id order and checked with the original
+    condition, so a lookup stops at the first entry that really matches.
+
+    upsert() and delete() change single entries by their "id" without a
+    rebuild. An updated entry keeps its position, so match order stays that of
+    the file; a deleted one leaves an empty slot that is never matched.
+    """
+
+    mutable = True  # supports upsert() and delete()
+
+    def __init__(self, entries=()):
+        self._entries = []            # entry id -> knowledge base item
+        self._questions = []          # entry id -> lowercased question, None if it has none
+        self._token_sets = []         # entry id -> frozenset of question words
+        self._token_keys = {}         # inner word -> ids of questions keyed by it
+        self._suffix_keys = {}        # first word -> ids of questions keyed by it
+        self._prefix_keys = {}        # last word -> ids of questions keyed by it
+        self._substring_keys = {}     # word -> ids of one word questions
+        self._key_lengths = Counter() # substring key length -> number of such keys
+        self._unkeyed_ids = []        # questions with no words ("" or whitespace)
+        self._overlap_postings = {}   # word -> ids of questions posted under it
+        self._doc_freq = Counter()
+        self._placements = []         # entry id -> (table, key) pairs it is posted under
+        self._ids = {}                # item "id" -> entry id
+        self._deleted = 0
+
+        entries = list(entries)
+        for item in entries:
+            question = _question_of(item)
+            if question is not None:
+                self._doc_freq.update(set(question.split()))
+        for item in entries:
+            self._add(item, count=False)
+
+    def __len__(self):
+        return len(self._entries) - self._deleted
+
+    @property
+    def fully_identified(self):
+        """Whether every entry has an "id", so deltas can find the entries they change"""
+        return len(self._ids) == len(self)
+
+    @property
+    def entries(self):
+        """Items by entry id; deleted entries are None"""
+        return self._entries
+
+    def upsert(self, item):
+        """Add an item, or replace the one with the same "id" in place. Returns its entry id."""
+        key = item.get("id") if isinstance(item, dict) else None
+        entry_id = self._ids.get(key) if key is not None else None
+        if entry_id is None:
+            return self._add(item)
+        self._unpost(entry_id)
+        self._post(entry_id, item)
+        return entry_id
+
+    def entry_id(self, key):
+        """Entry id of the item with this "id", or None"""
+        return self._ids.get(key)
+
+    def delete(self, key):
+        """Remove the item with this "id"; returns False if there is none"""
+        entry_id = self._ids.get(key)
+        if entry_id is None:
+            return False
+        self._unpost(entry_id)
+        self._deleted += 1
+        return True
+
+    def _add(self, item, count=True):
+        entry_id = len(self._entries)
+        self._entries.append(None)
+        self._questions.append(None)
+        self._token_sets.append(frozenset())
+        self._placements.append(())
+        self._post(entry_id, item, count)
+        return entry_id
+
+    def _post(self, entry_id, item, count=True):
+        """Put item in slot entry_id and add the slot to the lookup tables"""
+        question = _question_of(item)
+        tokens = frozenset(question.split()) if question is not None else frozenset()
+
+        self._entries[entry_id] = item
+        self._questions[entry_id] = question
+        self._token_sets[entry_id] = tokens
+        key = item.get("id") if isinstance(item, dict) else None
+        if key is not None:
+            self._ids[key] = entry_id
+        if question is None:
+            return
+        if count:
+            self._doc_freq.update(tokens)
+
+        if not tokens:
+            insort(self._unkeyed_ids, entry_id)
+            self._placements[entry_id] = ((None, None),)
+            return
+
+        words = question.split()
+        if len(words) == 1:
+            key, table = words[0], self._substring_keys
+            if key not in table:
+                self._key_lengths[len(key)] += 1
+        else:
+            options = [(words[0], self._suffix_keys), (words[-1], self._prefix_keys)]
+            options.extend((word, self._token_keys) for word in words[1:-1])
+            key, table = min(options, key=lambda option: self._doc_freq[option[0]])
+        placements = [(table, key)]
+
+        prefix = sorted(tokens, key=lambda t: (self._doc_freq[t], t))[:len(tokens) // 2 + 1]
+        placements.extend((self._overlap_postings, token) for token in prefix)
+        for table, key in placements:
+            ids = table.get(key)
+            if ids is None:
+                table[key] = [entry_id]
+            elif ids[-1] < entry_id:
+                ids.append(entry_id)
+            else:
+                insort(ids, entry_id)
+        self._placements[entry_id] = tuple(placements)
+
+    def _unpost(self, entry_id):
+        """Take slot entry_id out of the lookup tables and leave it empty"""
+        for table, key in self._placements[entry_id]:
+            if table is None:
+                _discard(self._unkeyed_ids, entry_id)
+                continue
+            ids = table[key]
+            _discard(ids, entry_id)
+            if not ids:
+                del table[key]
+                if table is self._substring_keys:
+                    self._key_lengths[len(key)] -= 1
+                    if not self._key_lengths[len(key)]:
+                        del self._key_lengths[len(key)]
+
+        item = self._entries[entry_id]
+        key = item.get("id") if isinstance(item, dict) else None
+        if key is not None and self._ids.get(key) == entry_id:
+            del self._ids[key]
+        if self._questions[entry_id] is not None:
+            self._doc_freq.subtract(self._token_sets[entry_id])
+        self._entries[entry_id] = None
+        self._questions[entry_id] = None
+        self._token_sets[entry_id] = frozenset()
+        self._placements[entry_id] = ()
+
+    def match(self, user_input):
+        """Return the knowledge base item find_answer should answer with, or None"""
+        text = user_input.lower()
+        input_tokens = set(text.split())
+
+        entry_id = self._substring_match(text, input_tokens)
+        if entry_id is None:
+            entry_id = self._overlap_match(input_tokens)
+        if entry_id is None:
+            return None
+        return self._entries[entry_id]
+
+    def _substring_match(self, text, input_tokens):
+        token_keys = self._token_keys
+        suffix_keys = self._suffix_keys
+        prefix_keys = self._prefix_keys
+        substring_keys = self._substring_keys
+        lengths = self._key_lengths
+        lists = [self._unkeyed_ids]
+        for token in input_tokens:
+            ids = token_keys.get(token)
+            if ids:
+                lists.append(ids)
+            size = len(token)
+            for start in range(size):
+                ids = suffix_keys.get(token[start:])
+                if ids:
+                    lists.append(ids)
+                ids = prefix_keys.get(token[:start + 1])
+                if ids:
+                    lists.append(ids)
+            for length in lengths:
+                for start in range(size - length + 1):
+                    ids = substring_keys.get(token[start:start + length])
+                    if ids:
+                        lists.append(ids)
+
+        questions = self._questions
+        for entry_id in _ascending_unique(lists):
+            if questions[entry_id] in text:
+                return entry_id
+        return None
+
+    def _overlap_match(self, input_tokens):
+        # no question words means 0 >= 0, which matches any input
+        lists = [self._unkeyed_ids[:1]]
+        postings = self._overlap_postings
+        for token in input_tokens:
+            ids = postings.get(token)
+            if ids:
+                lists.append(ids)
+
+        token_sets = self._token_sets
+        for entry_id in _ascending_unique(lists):
+            question_words = token_sets[entry_id]
+            if len(question_words & input_tokens) >= len(question_words) / 2:
+                return entry_id
+        return None
+
+
+def _ascending_unique(lists):
+    """Yield the ids in sorted id lists in ascending order without repeats"""
+    if sum(map(len, lists)) <= _EAGER_MERGE_LIMIT:
+        yield from sorted(set(chain.from_iterable(lists)))
+        return
+    # long postings are merged lazily so matching stops at the first hit
+    previous = None
+    for entry_id in heapq.merge(*lists):
+        if entry_id != previous:
+            previous = entry_id
+            yield entry_id
+
+
+def _discard(ids, entry_id):
+    position = bisect_left(ids, entry_id)
+    if position < len(ids) and ids[position] == entry_id:
+        del ids[position]
+
+
+def _question_of(item):
+    question = item.get("question") if isinstance(item, dict) else None
+    return question.lower() if isinstance(question, str) else None
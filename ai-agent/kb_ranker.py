@@ -0,0 +1,169 @@
+import math
+import re
+from collections import Counter, namedtuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+RankedMatch = namedtuple('RankedMatch', ['entry_id', 'score', 'question', 'answer'])
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _term_counts(item):
+    question = item.get("question") if isinstance(item, dict) else None
+    return Counter(tokenize(question)) if isinstance(question, str) else Counter()
+
+
+class TfidfRanker:
+    """Cosine-similarity TF-IDF ranking over every knowledge base question.
+
+    Unlike find_answer, which returns the first entry that clears the overlap
+    threshold, this scores all entries and returns the best ones, so file
+    order no longer decides the answer. Document vectors are stored column-wise
+    (term -> documents and weights), so scoring a query is one vectorized
+    scatter-add over the postings of its own terms followed by a partial sort.
+
+    update() re-indexes a single entry without a rebuild: the built postings
+    of a changed entry are masked out and its new vector kept in a small
+    overlay that is scored alongside them. Overlay vectors use the IDF as of
+    the update and the built ones keep theirs, so scores drift slightly from a
+    fresh build until the next one; drift counts the updates since the build.
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        # entries without a question get no postings and are never returned
+        documents = [_term_counts(item) for item in self.entries]
+
+        self.vocabulary = {}
+        doc_freq = Counter()
+        for counts in documents:
+            doc_freq.update(counts.keys())
+        for term in sorted(doc_freq):
+            self.vocabulary[term] = len(self.vocabulary)
+
+        total = len(documents)
+        self.idf = np.empty(len(self.vocabulary), dtype=np.float32)
+        for term, term_id in self.vocabulary.items():
+            self.idf[term_id] = math.log((1 + total) / (1 + doc_freq[term])) + 1.0
+
+        postings = [[] for _ in self.vocabulary]
+        for doc_id, counts in enumerate(documents):
+            weights = {self.vocabulary[t]: c * self.idf[self.vocabulary[t]] for t, c in counts.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term_id, weight in weights.items():
+                postings[term_id].append((doc_id, weight / norm))
+
+        self.term_ptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        self.term_ptr[1:] = np.cumsum([len(p) for p in postings])
+        self.term_docs = np.fromiter((d for p in postings for d, _ in p), dtype=np.int64,
+                                     count=int(self.term_ptr[-1]))
+        self.term_weights = np.fromiter((w for p in postings for _, w in p), dtype=np.float32,
+                                        count=int(self.term_ptr[-1]))
+
+        self._built_docs = total
+        self._built_terms = len(self.vocabulary)
+        self._term_names = sorted(doc_freq)  # term id -> term
+        self._doc_freq = doc_freq
+        self._masked = set()  # built entries replaced or deleted since
+        self._masked_ids = None  # the same as an array, made on the next query
+        self._overlay = {}           # entry id -> {term id: weight}, entries updated since the build
+        self._overlay_postings = {}  # term id -> {entry id: weight}
+        self.drift = 0  # updates since the build
+
+    def update(self, doc_id, item):
+        """Re-index one entry (item None: deleted) in place, without rebuilding"""
+        self.drift += 1
+        if doc_id in self._overlay:
+            old_terms = []
+            for term_id in self._overlay.pop(doc_id):
+                del self._overlay_postings[term_id][doc_id]
+                old_terms.append(self._term_names[term_id])
+        elif doc_id < self._built_docs and doc_id not in self._masked:
+            self._masked.add(doc_id)
+            self._masked_ids = None
+            old_terms = list(_term_counts(self.entries[doc_id]))
+        else:
+            old_terms = []
+        self._doc_freq.subtract(old_terms)
+
+        if doc_id >= len(self.entries):
+            self.entries.extend([None] * (doc_id + 1 - len(self.entries)))
+        self.entries[doc_id] = item
+        counts = _term_counts(item)
+        if not counts:
+            return
+        self._doc_freq.update(counts.keys())
+        weights = {}
+        for term, count in counts.items():
+            idf = math.log((1 + len(self.entries)) / (1 + self._doc_freq[term])) + 1.0
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = self.vocabulary[term] = len(self._term_names)
+                self._term_names.append(term)
+                self.idf = np.append(self.idf, np.float32(idf))
+            weights[term_id] = count * idf
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        vector = self._overlay[doc_id] = {term_id: weight / norm for term_id, weight in weights.items()}
+        for term_id, weight in vector.items():
+            self._overlay_postings.setdefault(term_id, {})[doc_id] = weight
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _query_terms(self, text):
+        counts = Counter(self.vocabulary[t] for t in tokenize(text) if t in self.vocabulary)
+        if not counts:
+            return (), ()
+        term_ids = list(counts)
+        weights = np.array([counts[t] for t in term_ids], dtype=np.float32) * self.idf[term_ids]
+        return term_ids, weights / np.linalg.norm(weights)
+
+    def rank_many(self, queries, k=3, min_score=0.0):
+        """Return the top-k RankedMatch list for each query, best first"""
+        return [self._rank(text, k, min_score) for text in queries]
+
+    def _rank(self, text, k, min_score):
+        term_ids, query_weights = self._query_terms(text)
+        if not len(term_ids):
+            return []
+
+        docs, values = [], []
+        for term_id, query_weight in zip(term_ids, query_weights):
+            if term_id < self._built_terms:
+                start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+                docs.append(self.term_docs[start:end])
+                values.append(self.term_weights[start:end] * query_weight)
+        if docs:
+            scores = np.bincount(np.concatenate(docs), weights=np.concatenate(values),
+                                 minlength=len(self.entries))
+        else:
+            scores = np.zeros(len(self.entries))
+        if self.drift:
+            if self._masked_ids is None:
+                self._masked_ids = np.fromiter(self._masked, dtype=np.int64, count=len(self._masked))
+            scores[self._masked_ids] = 0.0
+            for term_id, query_weight in zip(term_ids, query_weights):
+                for doc_id, weight in self._overlay_postings.get(term_id, {}).items():
+                    scores[doc_id] += query_weight * weight
+
+        candidates = np.flatnonzero(scores >= max(min_score, 1e-9))
+        if len(candidates) > k:
+            top = np.argpartition(scores[candidates], len(candidates) - k)[-k:]
+            candidates = candidates[top]
+        # highest score first, earlier entry wins a tie
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        matches = []
+        for doc_id in candidates:
+            item = self.entries[doc_id]
+            matches.append(RankedMatch(int(doc_id), float(scores[doc_id]), item["question"], item["answer"]))
+        return matches
+
+    def rank(self, text, k=3, min_score=0.0):
+        """Return the top-k RankedMatch list for a single query"""
+        return self.rank_many([text], k, min_score)[0]
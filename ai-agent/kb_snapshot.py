@@ -0,0 +1,339 @@
+"""Compact binary knowledge base snapshots, loaded with mmap.
+
+A snapshot holds the entries and the KnowledgeIndex lookup tables already
+built, so loading one is a header check and an mmap instead of parsing the
+JSON file and indexing every question. Every agent process that maps the
+same file shares its pages.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header      magic, format version, entry count, CRC-32 of everything
+                after the header, SHA-256 of the JSON file it was built from
+    directory   (name, offset, length) for each section
+    strings     interned UTF-8 strings: offsets (uint32) and data
+    entries     4 string ids per entry: id, question, answer, lowercased question
+    tables      per lookup table an open-addressing hash table of
+                (term string id, postings offset, postings length) slots,
+                keyed by CRC-32 of the term, and its uint32 postings
+    meta        small JSON object (substring key lengths, unkeyed ids)
+
+Convert the file the backend writes with:
+
+    python kb_snapshot.py knowledge_base.json knowledge_base.kbs
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+from kb_index import KnowledgeIndex
+
+MAGIC = b"SKBS"
+FORMAT_VERSION = 1
+NONE = 0xFFFFFFFF  # string id of a missing value / an empty hash slot
+
+_HEADER = struct.Struct("<4sHHII32s")  # magic, format, section count, entries, body crc, source sha256
+_SECTION = struct.Struct("<32sQQ")     # name, offset, length
+_TABLES = ("token_keys", "suffix_keys", "prefix_keys", "substring_keys", "overlap_postings")
+
+
+class SnapshotError(ValueError):
+    """The snapshot file is corrupt, from another format version or stale"""
+
+
+def source_digest(raw):
+    """SHA-256 of the JSON file contents a snapshot is built from"""
+    return hashlib.sha256(raw).digest()
+
+
+def _u32(values):
+    data = array("I", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 8)
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.data = bytearray()
+        self.offsets = [0]
+
+    def add(self, value):
+        if not isinstance(value, str):
+            return NONE
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.offsets) - 1
+            self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return string_id
+
+
+def _hash_table(table, strings):
+    """Serialize {term: ascending ids} as (slots, postings)"""
+    size = 1
+    while size < 2 * len(table):
+        size *= 2
+    slots = [NONE, 0, 0] * size
+    postings = []
+    for term, ids in table.items():
+        slot = zlib.crc32(term.encode("utf-8")) & (size - 1)
+        while slots[3 * slot] != NONE:
+            slot = (slot + 1) & (size - 1)
+        slots[3 * slot:3 * slot + 3] = [strings.add(term), len(postings), len(ids)]
+        postings.extend(ids)
+    return _u32(slots), _u32(postings)
+
+
+def write_snapshot(entries, path, digest=b"\0" * 32, index=None):
+    """Write entries (and their index, built here unless given) to path as a snapshot, atomically"""
+    if index is None:
+        index = KnowledgeIndex(entries)
+    strings = _StringTable()
+    rows = []
+    for item, question in zip(index.entries, index._questions):
+        fields = item if isinstance(item, dict) else {}
+        rows.extend((strings.add(fields.get("id")), strings.add(fields.get("question")),
+                     strings.add(fields.get("answer")), strings.add(question)))
+
+    sections = [("entries", _u32(rows))]
+    for name in _TABLES:
+        slots, postings = _hash_table(getattr(index, "_" + name), strings)
+        sections.append((name + ".slots", slots))
+        sections.append((name + ".ids", postings))
+    meta = {
+        "key_lengths": dict(index._key_lengths),
+        "unkeyed_ids": list(index._unkeyed_ids),
+        "identified": index.fully_identified
+    }
+    sections.append(("meta", json.dumps(meta).encode("utf-8")))
+    # strings last, every other section has added its terms by now
+    sections.append(("string_offsets", _u32(strings.offsets)))
+    sections.append(("string_data", bytes(strings.data)))
+
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    offset += -offset % 8
+    directory = []
+    body = bytearray()
+    for name, data in sections:
+        directory.append(_SECTION.pack(name.encode("ascii"), offset + len(body), len(data)))
+        body += _pad(data)
+    head = _pad(b"".join(directory))
+    crc = zlib.crc32(body, zlib.crc32(head))
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), len(index.entries), crc, digest)
+
+    directory_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".kb-snapshot-", dir=directory_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(head)
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return index
+
+
+def load_snapshot(path, digest=None, verify=True):
+    """Map a snapshot and return its MappedKnowledgeIndex.
+
+    Raises SnapshotError if the file is not a snapshot of this format, fails
+    its checksum, or (when digest is given) was built from a different JSON.
+    """
+    with open(path, "rb") as f:
+        # an empty file (a crash before the first write, say) can't be mapped at all
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise SnapshotError("file too short")
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise SnapshotError(f"cannot map snapshot: {e}") from e
+    try:
+        magic, version, count, entry_count, crc, source = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(f"not a version {FORMAT_VERSION} knowledge base snapshot")
+        if digest is not None and source != digest:
+            raise SnapshotError("snapshot is stale, it was built from a different knowledge base file")
+        if verify and zlib.crc32(memoryview(mapped)[_HEADER.size:]) != crc:
+            raise SnapshotError("snapshot checksum mismatch")
+        sections = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(mapped, _HEADER.size + i * _SECTION.size)
+            sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+        return MappedKnowledgeIndex(mapped, sections, entry_count)
+    except (struct.error, KeyError, ValueError) as e:
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # views into it are still alive, the map goes when they do
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"malformed snapshot: {e}") from e
+
+
+class _MappedStrings:
+    """String table read straight from the map; slicing an mmap gives bytes"""
+
+    def __init__(self, mapped, base, offsets):
+        self.mapped = mapped
+        self.base = base
+        self.offsets = offsets
+
+    def raw(self, string_id):
+        base = self.base
+        return self.mapped[base + self.offsets[string_id]:base + self.offsets[string_id + 1]]
+
+    def get(self, string_id):
+        if string_id == NONE:
+            return None
+        return self.raw(string_id).decode("utf-8")
+
+
+class _MappedTable:
+    """Read-only {term: ids} view over one serialized hash table"""
+
+    def __init__(self, strings, slots, postings):
+        self.strings = strings
+        self.slots = slots
+        self.postings = postings
+        self.mask = len(slots) // 3 - 1
+
+    def get(self, term, default=None):
+        key = term.encode("utf-8")
+        slots = self.slots
+        slot = zlib.crc32(key) & self.mask
+        while True:
+            string_id = slots[3 * slot]
+            if string_id == NONE:
+                return default
+            if self.strings.raw(string_id) == key:
+                offset = slots[3 * slot + 1]
+                return self.postings[offset:offset + slots[3 * slot + 2]]
+            slot = (slot + 1) & self.mask
+
+
+class _Column:
+    """One value per entry, decoded from the entry rows on access"""
+
+    def __init__(self, rows, strings):
+        self.rows = rows
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.rows) // 4
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+class _Entries(_Column):
+    def __getitem__(self, entry_id):
+        rows, get = self.rows, self.strings.get
+        row = 4 * entry_id
+        if rows[row] == NONE and rows[row + 1] == NONE and rows[row + 2] == NONE:
+            return {}
+        item = {"question": get(rows[row + 1]), "answer": get(rows[row + 2])}
+        if rows[row] != NONE:
+            item = {"id": get(rows[row]), **item}
+        return item
+
+
+class _Questions(_Column):
+    def __getitem__(self, entry_id):
+        return self.strings.get(self.rows[4 * entry_id + 3])
+
+
+class _TokenSets(_Column):
+    def __getitem__(self, entry_id):
+        string_id = self.rows[4 * entry_id + 3]
+        if string_id == NONE:
+            return frozenset()
+        return frozenset(self.strings.raw(string_id).decode("utf-8").split())
+
+
+class MappedKnowledgeIndex(KnowledgeIndex):
+    """KnowledgeIndex answering from a mapped snapshot; match() is inherited unchanged.
+
+    Entries are decoded only when a lookup looks at them, so nothing is parsed
+    up front. The index is read-only: changes go to a regular KnowledgeIndex.
+    """
+    mutable = False
+
+    def __init__(self, mapped, sections, entry_count):
+        if sys.byteorder != "little":
+            raise SnapshotError("snapshots are little-endian only")
+        self._mapped = mapped
+        view = memoryview(mapped)
+
+        def u32(name):
+            offset, length = sections[name]
+            return view[offset:offset + length].cast("I")
+
+        strings = _MappedStrings(mapped, sections["string_data"][0], u32("string_offsets"))
+        rows = u32("entries")
+        if len(rows) != 4 * entry_count:
+            raise SnapshotError("entry table size does not match the header")
+        for name in _TABLES:
+            setattr(self, "_" + name, _MappedTable(strings, u32(name + ".slots"), u32(name + ".ids")))
+        offset, length = sections["meta"]
+        meta = json.loads(mapped[offset:offset + length].decode("utf-8"))
+        self._key_lengths = {int(k): v for k, v in meta["key_lengths"].items()}
+        self._unkeyed_ids = meta["unkeyed_ids"]
+        self._identified = meta["identified"]
+        self._deleted = 0
+        self._entries = _Entries(rows, strings)
+        self._questions = _Questions(rows, strings)
+        self._token_sets = _TokenSets(rows, strings)
+
+    @property
+    def fully_identified(self):
+        return self._identified
+
+    def upsert(self, item):
+        raise TypeError("a mapped knowledge base snapshot is read-only")
+
+    def delete(self, key):
+        raise TypeError("a mapped knowledge base snapshot is read-only")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert knowledge_base.json to a binary snapshot")
+    parser.add_argument("source", nargs="?", default="knowledge_base.json")
+    parser.add_argument("target", nargs="?", default="knowledge_base.kbs")
+    parser.add_argument("--check", action="store_true", help="only check that target is a current snapshot of source")
+    args = parser.parse_args()
+
+    with open(args.source, "rb") as f:
+        raw = f.read()
+    digest = source_digest(raw)
+    if args.check:
+        try:
+            index = load_snapshot(args.target, digest)
+        except (OSError, SnapshotError) as e:
+            print(f"{args.target}: {e}")
+            sys.exit(1)
+        print(f"{args.target}: current, {len(index)} entries")
+        return
+
+    entries = json.loads(raw)
+    if not isinstance(entries, list):
+        sys.exit(f"{args.source}: knowledge base must be a JSON list")
+    write_snapshot(entries, args.target, digest)
+    print(f"Wrote {len(entries)} entries to {args.target} ({os.path.getsize(args.target)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
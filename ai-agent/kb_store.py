@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from kb_index import KnowledgeIndex
+
+# deltas a snapshot remembers, so processes following it (match_pool workers) can catch up without a reload
+DELTA_HISTORY = 64
+
+
+class KnowledgeBaseSnapshot:
+    """One version of the knowledge base as read from disk; kb_delta changes update it in place"""
+    __slots__ = ('entries', 'index', 'version', 'signature', 'loaded_version', 'deltas', '_ranker')
+
+    def __init__(self, entries, version, signature, index=None):
+        self.index = index if index is not None else KnowledgeIndex(entries)
+        self.entries = self.index.entries  # deleted entries are None
+        self.version = version
+        self.signature = signature
+        self.loaded_version = version  # the version the file was loaded at, before any deltas
+        self.deltas = []  # (version, delta) for the latest deltas applied since
+        self._ranker = None
+
+    def _continues(self, other):
+        """Take over other's load and delta history, for a copy of it"""
+        self.loaded_version = other.loaded_version
+        self.deltas = other.deltas
+
+    @property
+    def ranker(self):
+        """TF-IDF ranker for this version, built the first time ranked matching is used"""
+        if self._ranker is None:
+            from kb_ranker import TfidfRanker
+            self._ranker = TfidfRanker(self.entries)
+        return self._ranker
+
+    def answer(self, user_input, mode="first", min_score=0.0):
+        """Answer for a question in "first" (substring/overlap) or "ranked" (TF-IDF) mode, or None"""
+        if mode == "ranked":
+            matches = self.ranker.rank(user_input, k=1, min_score=min_score)
+            return matches[0].answer if matches else None
+
+        item = self.index.match(user_input)
+        if item is None:
+            return None
+        return item["answer"]
+
+    def __len__(self):
+        return len(self.index)
+
+
+class KnowledgeBaseStore:
+    """Keeps the knowledge base resident and reloads it only when the file changes.
+
+    Readers call snapshot() and keep using the object they got back; a reload
+    builds a complete new snapshot and swaps it in with a single assignment, so
+    concurrent message handlers never see a half-loaded knowledge base. Called
+    on an event loop, snapshot() only stats the file; a changed file is loaded
+    on a thread while the loop keeps answering from the current snapshot.
+
+    Deltas pushed by the backend are applied to the current snapshot in place
+    instead, one synchronous call each, so handlers on the event loop see each
+    change whole. While deltas are being pushed, polling can be switched off.
+    """
+
+    def __init__(self, path='knowledge_base.json', check_interval=0.5, snapshot=None, snapshot_path=None):
+        self.path = path
+        # optional binary snapshot (kb_snapshot.py) mapped instead of parsing the JSON when current
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval  # seconds between stat() calls
+        # a preloaded snapshot (e.g. inherited by a forked worker) is kept until the file changes
+        self._snapshot = snapshot or KnowledgeBaseSnapshot([], 0, None)
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._missing_reported = False
+        self.polling = True  # False while deltas are pushed, the file is then only read on request
+        self._reload = None  # background reload started by snapshot() on an event loop
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def current(self):
+        """The loaded snapshot, without checking the file"""
+        return self._snapshot
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the file has changed (off the loop on an event loop)"""
+        now = time.monotonic()
+        if self.polling and now >= self._next_check:
+            self._next_check = now + self.check_interval
+            if self._snapshot.signature is None or not _on_event_loop():
+                # nothing loaded yet (agents warm up on a thread), or already off the loop
+                self.refresh()
+            else:
+                self._refresh_in_background()
+        return self._snapshot
+
+    def _refresh_in_background(self):
+        if self._reload is not None and not self._reload.done():
+            return
+        try:
+            signature = self._file_signature()
+        except OSError:
+            self.refresh()  # only reports the missing file
+            return
+        if signature != self._snapshot.signature:
+            # parsing, indexing and writing the binary snapshot take seconds for a large KB
+            self._reload = asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    def _file_signature(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def refresh(self, force=False):
+        """Reload the file if its inode, size or mtime changed (or regardless, with force). Returns True on reload."""
+        try:
+            signature = self._file_signature()
+        except OSError as e:
+            if not self._missing_reported:
+                print(f"Error loading knowledge base: {e}")
+                self._missing_reported = True
+            return False
+        self._missing_reported = False
+
+        if signature == self._snapshot.signature and not force:
+            return False
+
+        with self._lock:
+            if signature == self._snapshot.signature and not force:
+                return False
+            index = None
+            try:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                # the backend rewrites the file in place, so a read can race a
+                # write; only accept it if nothing changed while we were reading
+                if self._file_signature() != signature:
+                    return False
+                if self.snapshot_path:
+                    index = self._map_snapshot(raw)
+                if index is None:
+                    entries = json.loads(raw)
+                    if not isinstance(entries, list):
+                        raise ValueError("knowledge base must be a JSON list")
+            except (OSError, ValueError) as e:
+                # keep serving the previous snapshot, retry on the next check
+                print(f"Error loading knowledge base: {e}")
+                return False
+
+            if index is not None:
+                snapshot = KnowledgeBaseSnapshot(None, self._snapshot.version + 1, signature, index)
+                print(f"Mapped {len(index)} entries from knowledge base snapshot {self.snapshot_path}")
+            else:
+                snapshot = KnowledgeBaseSnapshot(entries, self._snapshot.version + 1, signature)
+                print(f"Loaded {len(entries)} entries from knowledge base")
+                if self.snapshot_path:
+                    self._write_snapshot(snapshot, raw)
+            if self._snapshot._ranker is not None:
+                snapshot.ranker  # ranked mode is in use, build it here rather than on the next question
+            self._snapshot = snapshot
+            return True
+
+    def _map_snapshot(self, raw):
+        """The binary snapshot's index if it was built from exactly this JSON, else None"""
+        from kb_snapshot import SnapshotError, load_snapshot, source_digest
+        try:
+            return load_snapshot(self.snapshot_path, source_digest(raw))
+        except FileNotFoundError:
+            return None
+        except (OSError, SnapshotError) as e:
+            print(f"Not using knowledge base snapshot: {e}")
+            return None
+
+    def _write_snapshot(self, snapshot, raw):
+        """Save the freshly built index so the next process can map it"""
+        from kb_snapshot import source_digest, write_snapshot
+        try:
+            write_snapshot(snapshot.entries, self.snapshot_path, source_digest(raw), snapshot.index)
+        except OSError as e:
+            print(f"Could not write knowledge base snapshot: {e}")
+
+    @property
+    def background_reload(self):
+        """The reload snapshot() started on the event loop, while it runs"""
+        if self._reload is not None and not self._reload.done():
+            return self._reload
+        return None
+
+    def make_mutable(self):
+        """Swap a mapped (read-only) snapshot for an in-memory copy deltas can change.
+
+        Copying re-indexes every entry, seconds for a large KB; KnowledgeSync runs it off the loop.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if not snapshot.index.mutable:
+                ranker = snapshot._ranker  # same entry ids, so it carries over
+                copy = KnowledgeBaseSnapshot(list(snapshot.entries), snapshot.version, snapshot.signature)
+                copy._continues(snapshot)
+                copy._ranker = ranker
+                self._snapshot = copy
+        return True
+
+    def apply_delta(self, delta):
+        """Apply one {"op": "upsert", "entry": {...}} or {"op": "delete", "id": ...} change"""
+        if not self._snapshot.index.fully_identified:
+            # loaded from a file written before entries had ids: only a reload can bring it up to date
+            raise ValueError("knowledge base entries have no ids, reload it instead")
+        self.make_mutable()
+        with self._lock:
+            snapshot = self._snapshot
+            op = delta.get("op")
+            if op == "upsert":
+                entry_id = snapshot.index.upsert(delta["entry"])
+            elif op == "delete":
+                entry_id = snapshot.index.entry_id(delta["id"])
+                snapshot.index.delete(delta["id"])
+            else:
+                raise ValueError(f"unknown knowledge base delta op {op!r}")
+            if snapshot._ranker is not None and entry_id is not None:
+                # ranked mode re-indexes just this entry; a full rebuild waits for the next reload
+                snapshot._ranker.update(entry_id, snapshot.entries[entry_id])
+            snapshot.version += 1
+            snapshot.deltas.append((snapshot.version, delta))
+            del snapshot.deltas[:-DELTA_HISTORY]
+            # the signature stays that of the file last loaded: the file may already hold
+            # changes not pushed yet, and resyncs and polling must still see it as changed
+
+            deleted = len(snapshot.entries) - len(snapshot)
+            if deleted > 1000 and deleted > len(snapshot):
+                # mostly empty slots now, rebuild from the live entries
+                live = [item for item in snapshot.entries if item is not None]
+                compacted = KnowledgeBaseSnapshot(live, snapshot.version, snapshot.signature)
+                compacted._continues(snapshot)
+                self._snapshot = compacted
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+
+class KnowledgeSync:
+    """Keeps a KnowledgeBaseStore current from the deltas ws_server pushes to agents.
+
+    Deltas carry the server's epoch and a version number and are applied in
+    order. On a gap, or when the server answers our hello with kb_reset, the
+    store reloads the file (which the backend writes before pushing) and
+    carries on from the server's version. File polling is off while connected.
+
+    On an event loop the reload runs on a thread; deltas arriving meanwhile
+    are held and applied once it is done, so none land on the snapshot the
+    reload is about to replace. The same goes for the other slow steps a
+    delta can need: a file whose entries have no ids can only be reloaded,
+    and a mapped snapshot is copied into memory before its first change.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.epoch = None
+        self.version = None
+        self.applied = 0
+        self.reloads = 0
+        self._pending = None  # the reload (or copy) in progress, if any
+        self._held = []       # deltas received during it
+        self._copy_inline = False
+
+    def hello(self, agent_id=None, **fields):
+        """Handshake telling the server who we are and which deltas (and, in fields, other updates) we already have"""
+        return json.dumps({'type': 'hello', 'role': 'agent', 'agent_id': agent_id,
+                           'kb_epoch': self.epoch, 'kb_version': self.version, **fields})
+
+    def connected(self):
+        self.store.polling = False
+
+    def disconnected(self):
+        self.store.polling = True
+
+    def handle(self, data):
+        """Apply a kb_delta or kb_reset message; returns False for any other message"""
+        if data.get('type') == 'kb_reset':
+            self._reload(data)
+        elif data.get('type') == 'kb_delta':
+            if self._pending is not None:
+                self._held.append(data)
+            elif data.get('epoch') != self.epoch or self.version is None or data.get('version', 0) > self.version + 1:
+                self._reload(data)
+            elif data['version'] == self.version + 1:
+                self._apply(data)
+            # anything older was already applied, or is in the file we reloaded
+        else:
+            return False
+        return True
+
+    def _apply(self, data):
+        store = self.store
+        if not store.current.index.fully_identified:
+            # written before entries had ids: the file (written before the push) already has this change
+            self._reload(data)
+            return
+        if store.background_reload is not None:
+            # a polled reload is still replacing the snapshot, wait for it rather than for its lock
+            self._wait(store.background_reload, data)
+            return
+        if not store.current.index.mutable and not self._copy_inline:
+            copy = self._in_executor(store.make_mutable)
+            if copy is not None:
+                self._wait(copy, data, self._copied)
+                return
+        try:
+            store.apply_delta(data)
+        except (KeyError, ValueError) as e:
+            print(f"Bad knowledge base delta {data.get('version')}: {e}")
+            self._reload(data)
+            return
+        self.version = data['version']
+        self.applied += 1
+
+    def _reload(self, data):
+        self.epoch = data.get('epoch')
+        self.version = data.get('version')
+        self.reloads += 1
+        # forced: the file may hold changes we never applied even if its signature is the one we loaded
+        reload = self._in_executor(self.store.refresh, True)
+        if reload is None:
+            self._reloaded(self.store.refresh(force=True))
+        else:
+            self._wait(reload, None, self._reloaded)
+
+    def _in_executor(self, fn, *args):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return loop.run_in_executor(None, fn, *args)
+
+    def _wait(self, task, delta, done=None):
+        """Hold deltas (starting with delta) until task finishes, then call done(ok) and apply them"""
+        self._pending = task
+        self._held = [delta] if delta is not None else []
+        task.add_done_callback(lambda task: self._finished(task, done))
+
+    def _finished(self, task, done):
+        if task is not self._pending:
+            return  # a later resync replaced it, and its deltas
+        self._pending = None
+        held, self._held = self._held, []
+        if done is not None:
+            done(not task.cancelled() and task.exception() is None and task.result())
+        if held and not self.store.current.index.fully_identified:
+            held = held[-1:]  # each would reload the file, and the last one's reload covers them all
+        for delta in held:
+            self.handle(delta)
+
+    def _copied(self, ok):
+        if not ok:
+            # don't keep retrying on a thread; apply_delta copies inline from now on
+            print("Copying the mapped knowledge base failed, copying it inline instead")
+            self._copy_inline = True
+
+    def _reloaded(self, ok):
+        if ok:
+            print(f"Knowledge base resynced at version {self.version}")
+        else:
+            # the store keeps the signature of what it last loaded, so polling retries until it succeeds
+            print(f"Knowledge base resync to version {self.version} failed, polling the file until it loads")
+            self.store.polling = True
+
+    def stats(self):
+        return {'epoch': self.epoch, 'version': self.version, 'applied': self.applied, 'reloads': self.reloads}
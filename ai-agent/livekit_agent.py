@@ -1,26 +1,210 @@
 import asyncio
+import atexit
+import os
+import random
+import time
 import uuid
 import sys
-import requests
-import websockets
 import json
 
-try:
-    from livekit import rtc
-    from livekit.api import AccessToken, VideoGrants
-except ImportError as e:
-    print(f"ERROR: LiveKit SDK not properly installed. {e}")
-    sys.exit(1)
-
+import config
 from config import HOST, API_KEY, API_SECRET, ROOM_NAME
-from agent import find_answer
+import envelope
+from agent import answer_cache, kb_sync, find_answer, find_answer_async, start_matching_pool, warm_up
+from escalation import EscalationClient, EscalationCoalescer, EscalationError
+from http_api import HTTPServer
+from metrics import StageTimings, metrics_route, registry
+from normalize import normalize_question
+from replay_log import ReplayCursor
+from request_registry import RequestRegistry
+from scheduler import CallerScheduler
+
+AGENT_IDENTITY = getattr(config, "AGENT_IDENTITY", "salon-ai-agent")
+BACKEND_WS_URL = "ws://localhost:8765"
+# reconnects back off exponentially with jitter, so agents don't all retry at once after a server restart
+RECONNECT_MIN_DELAY = getattr(config, "RECONNECT_MIN_DELAY", 0.5)  # seconds
+RECONNECT_MAX_DELAY = getattr(config, "RECONNECT_MAX_DELAY", 30)
+# a backend connection that doesn't answer a ping within the timeout is dropped and reconnected
+BACKEND_PING_INTERVAL = getattr(config, "BACKEND_PING_INTERVAL", 10)  # seconds
+BACKEND_PING_TIMEOUT = getattr(config, "BACKEND_PING_TIMEOUT", 10)
+PRUNE_INTERVAL = 60  # seconds between sweeps for expired help requests
+LATENCY_REPORT_INTERVAL = 60  # seconds between stage latency summaries
+# p99 from message received to KB answer published
+ANSWER_P99_BUDGET = getattr(config, "ANSWER_P99_BUDGET_MS", 250) / 1000
+WORKERS = getattr(config, "WORKERS", 8)
+CALLER_QUEUE_SIZE = getattr(config, "CALLER_QUEUE_SIZE", 20)
+MAX_QUEUED_MESSAGES = getattr(config, "MAX_QUEUED_MESSAGES", 1000)
+QUEUE_OVERFLOW = getattr(config, "QUEUE_OVERFLOW", "drop_oldest")  # or "drop_newest"
+# tells ws_server which help request updates are ours; one id per process and backend connection
+BACKEND_AGENT_ID = f"{AGENT_IDENTITY}-{uuid.uuid4().hex[:8]}"
+# Prometheus-style metrics on http://127.0.0.1:<port>/metrics; None turns the endpoint off
+METRICS_PORT = getattr(config, "METRICS_PORT", 9108)
+# per-message prints (questions, answers, escalations); errors and summaries are always printed
+VERBOSE = getattr(config, "VERBOSE", True)
+# last help request update seen on the backend connection, resumed from after a reconnect
+help_updates = ReplayCursor()
+# touched once the agent has joined its room with the knowledge base loaded, removed on exit
+READY_FILE = getattr(config, "READY_FILE", None)
+
+# the LiveKit SDK takes most of a cold start to import, so it is loaded on first use
+rtc = None
+AccessToken = VideoGrants = None
+
+
+def load_livekit():
+    """Import the LiveKit SDK into this module, exiting if it is not installed"""
+    global rtc, AccessToken, VideoGrants
+    if rtc is None:
+        try:
+            from livekit import rtc
+            from livekit.api import AccessToken, VideoGrants
+        except ImportError as e:
+            print(f"ERROR: LiveKit SDK not properly installed. {e}")
+            sys.exit(1)
+    return rtc
+
+
+async def serve_metrics(port=METRICS_PORT):
+    """Serve this process's metrics registry on a local port"""
+    if not port:
+        return None
+    server = HTTPServer("metrics", log_requests=False)
+    metrics_route(server)
+    try:
+        listener = await server.start("127.0.0.1", port)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    print(f"Metrics on http://127.0.0.1:{port}/metrics")
+    return listener
+
+
+def signal_ready(path=READY_FILE):
+    """Tell an orchestrator this process can take traffic by writing its pid to path"""
+    if not path:
+        return
+    with open(path, 'w') as f:
+        f.write(f"{os.getpid()}\n")
+    atexit.register(_remove_ready_file, path)
+    print(f"Ready, wrote {path}")
+
+
+def _remove_ready_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ResponsePolicy:
+    """How a room paces the agent's replies; the default publishes immediately"""
+
+    def __init__(self, min_reply_delay=0.0, welcome_delay=0.0):
+        self.min_reply_delay = min_reply_delay  # hold replies until this long after the question arrived
+        self.welcome_delay = welcome_delay      # wait this long after a caller joins before greeting
+
+    @classmethod
+    def for_room(cls, room_name):
+        """Policy configured for a room in config.ROOM_POLICIES, if any"""
+        policies = getattr(config, "ROOM_POLICIES", {})
+        return cls(**policies.get(room_name, {}))
+
+
+def reconnect_delay(attempt, min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY):
+    """Seconds to wait before reconnect attempt number attempt (0 first): doubling, capped, half of it random"""
+    delay = min(max_delay, min_delay * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def follow_backend_updates(on_message, url=BACKEND_WS_URL, agent_id=BACKEND_AGENT_ID, cursor=help_updates):
+    """Feed every message from the backend WebSocket to on_message, reconnecting forever.
+
+    The hello carries a resume token (the last help request update seen), so
+    the server replays whatever was sent while we were disconnected; updates
+    seen before are dropped here rather than answered twice.
+    """
+    import websockets
+    attempt = 0
+    while True:
+        try:
+            async with websockets.connect(url, ping_interval=BACKEND_PING_INTERVAL,
+                                          ping_timeout=BACKEND_PING_TIMEOUT) as ws:
+                print("✅ Connected to backend WebSocket")
+                # catch up on knowledge base changes and missed updates, then take them as pushed
+                await ws.send(kb_sync.hello(agent_id, **cursor.token('updates')))
+                kb_sync.connected()
+                
+                async for message in ws:
+                    attempt = 0  # the server is answering, so the next outage starts from the shortest delay
+                    if _is_new_update(message, cursor):
+                        await on_message(message)
+            print("Backend WebSocket closed")
+                    
+        except Exception as e:
+            print(f"WebSocket connection error: {e}")
+        kb_sync.disconnected()
+        
+        delay = reconnect_delay(attempt)
+        attempt += 1
+        print(f"Reconnecting to backend in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+def _is_new_update(message, cursor):
+    """Whether a backend message should be handled, advancing cursor past help request updates"""
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return True  # on_message reports it
+    if not isinstance(data, dict):
+        return True
+    if data.get('type') == 'help_updates_synced':
+        cursor.advance(data.get('epoch'), data.get('version'))
+        return False
+    if data.get('type') == 'pong':
+        return False
+    if data.get('type') == 'help_request_update':
+        return cursor.accept(data)
+    return True
+
 
 class SalonAIAgent:
-    def __init__(self):
-        self.room = rtc.Room()
+    """The agent for one LiveKit room; everything it tracks belongs to that room only"""
+
+    def __init__(self, room_name=ROOM_NAME, identity=AGENT_IDENTITY, policy=None,
+                 escalations=None, follow_backend=True, room=None):
+        self.room_name = room_name
+        self.identity = identity
+        # anything with rtc.Room's on/connect/local_participant will do, e.g. a stand-in for load tests
+        self.room = room if room is not None else load_livekit().Room()
         self.clients = {}  # trackimg active clients
-        self.pending_help_requests = {}  # tracking {request_id: caller_id}
-        self.websocket = None
+        self.pending_help_requests = RequestRegistry()  # tracking request_id -> callers waiting on it
+        self._reply_tails = {}  # caller -> the last of its replies still waiting to be sent off a worker
+        # a runtime serving many rooms shares one escalation client and one backend connection
+        self.escalations = escalations or EscalationClient(agent_id=BACKEND_AGENT_ID)
+        self.follow_backend = follow_backend
+        self.coalescer = EscalationCoalescer(self.escalations)
+        self.policy = policy or ResponsePolicy.for_room(room_name)
+        self.ready = asyncio.Event()  # set once the room is joined and the knowledge base is loaded
+        self.timings = StageTimings({'answered': ANSWER_P99_BUDGET}, registry, 'agent', room=room_name)
+        self.outcomes = {outcome: registry.counter("agent_messages_total", "Caller messages handled, by outcome",
+                                                   room=room_name, outcome=outcome)
+                         for outcome in (envelope.ANSWER, envelope.ESCALATION, envelope.ERROR)}
+        # messages are handled in order per caller by a fixed pool of workers
+        self.scheduler = CallerScheduler(self._process_message, workers=WORKERS,
+                                         queue_size=CALLER_QUEUE_SIZE,
+                                         max_pending=MAX_QUEUED_MESSAGES,
+                                         overflow=QUEUE_OVERFLOW)
+        registry.gauge("agent_queued_messages", lambda: self.scheduler.stats()['pending'],
+                       "Caller messages waiting for a worker", room=room_name)
+        registry.gauge("agent_dropped_messages", lambda: sum(self.scheduler.dropped.values()),
+                       "Caller messages dropped because a queue was full", room=room_name)
+        registry.gauge("agent_pending_help_requests", lambda: len(self.pending_help_requests),
+                       "Help requests waiting on a supervisor", room=room_name)
+        for reason in ('expired', 'size', 'disconnected'):
+            registry.gauge("agent_evicted_help_requests", lambda reason=reason: self.pending_help_requests.evictions[reason],
+                           "Pending help requests evicted before an answer, by reason", room=room_name, reason=reason)
+        registry.gauge("agent_callers", lambda: len(self.clients), "Callers in the room", room=room_name)
         
     async def connect(self):
         # liveKit event handlers set up
@@ -28,92 +212,117 @@ class SalonAIAgent:
         self.room.on("participant_connected", self._handle_participant_connected)
         self.room.on("participant_disconnected", self._handle_participant_disconnected)
         
-        # creating token for liveKit
-        token = AccessToken(API_KEY, API_SECRET)
-        token.with_grants(VideoGrants(room_join=True, room=ROOM_NAME))
-        token.identity = "salon-ai-agent"
-        jwt = token.to_jwt()
+        jwt = self._join_token()
         
         # connecting to liveKit room
         url = f"wss://{HOST}.livekit.cloud"
-        print(f"Connecting to LiveKit at {url}...")
+        print(f"Connecting to LiveKit room {self.room_name} at {url}...")
         
+        # load the knowledge base while the room connects; messages queue until both are done
+        warming = asyncio.ensure_future(asyncio.to_thread(warm_up))
         try:
             await self.room.connect(url, jwt)
-            print("✅ Connected! AI Agent is running.")
+            entries = await warming
+            print(f"✅ Connected to {self.room_name} with {entries} knowledge base entries! AI Agent is running.")
+            self.scheduler.start()
+            self.ready.set()
             
-            asyncio.create_task(self._maintain_websocket_connection())
+            if self.follow_backend:
+                asyncio.create_task(follow_backend_updates(self._handle_websocket_message))
+            asyncio.create_task(self._prune_pending_requests())
+            asyncio.create_task(self._report_latency())
             
             return True
         except Exception as e:
-            print(f"❌ Connection failed: {e}")
+            print(f"❌ Connection to {self.room_name} failed: {e}")
             return False
     
-    async def _maintain_websocket_connection(self):
-        """Maintain a WebSocket connection to the backend to listen for help request updates"""
+    def _join_token(self):
+        """Signed LiveKit token that lets this agent join its room"""
+        load_livekit()
+        token = AccessToken(API_KEY, API_SECRET)
+        token.with_grants(VideoGrants(room_join=True, room=self.room_name))
+        token.identity = self.identity
+        return token.to_jwt()
+    
+    def is_waiting_on(self, data):
+        """Whether a backend update is for a help request raised in this room"""
+        return any(key and key in self.pending_help_requests
+                   for key in (data.get('request_id'), data.get('db_id')))
+    
+    async def _prune_pending_requests(self):
+        """Periodically evict help requests that will never be answered"""
         while True:
-            try:
-                async with websockets.connect("ws://localhost:8765") as ws:
-                    self.websocket = ws
-                    print("✅ Connected to backend WebSocket")
-                    
-                    while True:
-                        message = await ws.recv()
-                        await self._handle_websocket_message(message)
-                        
-            except Exception as e:
-                print(f"WebSocket connection error: {e}")
-                self.websocket = None
-                
-            await asyncio.sleep(5)
+            await asyncio.sleep(PRUNE_INTERVAL)
+            self.pending_help_requests.prune()
+    
+    async def _report_latency(self):
+        """Periodically log per-stage latency and flag a blown p99 budget"""
+        while True:
+            await asyncio.sleep(LATENCY_REPORT_INTERVAL)
+            if not self.timings.stages:
+                continue
+            print(f"[{self.room_name}] Stage latency: {self.timings.summary()}")
+            print(f"[{self.room_name}] Scheduler: {self.scheduler.stats()}")
+            print(f"[{self.room_name}] Pending help requests: {self.pending_help_requests.stats()}")
+            print(f"Answer cache: {answer_cache.stats()}")
+            for stage, p99 in self.timings.over_budget().items():
+                budget = self.timings.budgets[stage]
+                print(f"⚠️ {stage} p99 {p99 * 1000:.1f}ms is over the {budget * 1000:.0f}ms budget")
     
     async def _handle_websocket_message(self, message):
         """Process messages from WebSocket (help request updates)"""
         try:
             data = json.loads(message)
-            print(f"Received WebSocket message: {data}")
+            if kb_sync.handle(data):
+                return
+            if VERBOSE:
+                print(f"Received WebSocket message: {data}")
             
             if 'type' in data and data['type'] == 'help_request_update':
                 request_id = data.get('request_id')
-                answer = data.get('answer')
                 status = data.get('status')
+                if data.get('resync') and not self.is_waiting_on(data):
+                    return  # resent after a server restart, but already answered here
                 
-                print(f"Help request update: {request_id}, status: {status}")
-                print(f"Pending help requests: {self.pending_help_requests}")
-                
-                if request_id in self.pending_help_requests and status == 'answered':
-                    caller_id = self.pending_help_requests[request_id]
-                    print(f"Found matching request for caller: {caller_id}")
-                    await self._send_supervisor_answer(caller_id, answer)
-                    
-                    del self.pending_help_requests[request_id]
+                if VERBOSE:
+                    print(f"Help request update: {request_id}, status: {status}")
+                if status == 'answered':
+                    await self._route_supervisor_answer(data)
             elif 'type' in data and data['type'] == 'resolve':
-                request_id = data.get('request_id')
-                answer = data.get('answer')
-                
-                print(f"Resolve request: {request_id}")
-                print(f"Pending help requests: {self.pending_help_requests}")
-                
-                for req_id, caller_id in list(self.pending_help_requests.items()):
-                    if req_id == request_id or req_id in request_id or request_id in req_id:
-                        print(f"Found matching request for caller: {caller_id}")
-                        await self._send_supervisor_answer(caller_id, answer)
-                        del self.pending_help_requests[req_id]
-                        break
+                if VERBOSE:
+                    print(f"Resolve request: {data.get('request_id')}")
+                await self._route_supervisor_answer(data)
                     
         except Exception as e:
             print(f"Error handling WebSocket message: {e}")
             import traceback
             traceback.print_exc()
     
-    async def _send_supervisor_answer(self, caller_id, answer):
+    async def _route_supervisor_answer(self, data):
+        """Send an answer to every caller waiting on the request it belongs to"""
+        # the backend may identify the request by our id or by its own database id
+        record = self.pending_help_requests.pop_any(data.get('request_id'), data.get('db_id'))
+        if record is None:
+            print(f"No pending help request for {data.get('request_id')}")
+            return
+        
+        if VERBOSE:
+            print(f"Found matching request for callers: {record.callers}")
+        await asyncio.gather(*[self._send_supervisor_answer(caller_id, data.get('answer'), record)
+                               for caller_id in record.callers])
+    
+    async def _send_supervisor_answer(self, caller_id, answer, record):
         """Send supervisor's answer back to the client"""
         try:
-            message = f"[Supervisor Answer]: {answer}"
-            print(f"Sending supervisor answer to room: {message}")
+            if VERBOSE:
+                print(f"Sending supervisor answer to {caller_id}: {answer}")
             
-            await self.room.local_participant.publish_data(message.encode('utf-8'))
-            print(f"Sent supervisor answer for {caller_id}: {answer}")
+            await self._send_to_caller(caller_id, envelope.SUPERVISOR_ANSWER, answer,
+                                       request_id=record.request_id,
+                                       correlation_id=record.correlation_ids.get(caller_id))
+            if VERBOSE:
+                print(f"Sent supervisor answer for {caller_id}: {answer}")
         except Exception as e:
             print(f"Error sending supervisor answer: {e}")
             import traceback
@@ -121,6 +330,7 @@ class SalonAIAgent:
             
     def _handle_data_received(self, *args):
         """Handle incoming data packets"""
+        received_at = time.perf_counter()
         try:
             data_packet = args[0]
             data_bytes = None
@@ -151,76 +361,158 @@ class SalonAIAgent:
                     participant = arg
                     break
             
-            message = data_bytes.decode('utf-8')
-            print(f"\n[Client: {sender_id}]: {message}")
+            data = envelope.decode(data_bytes)
+            self.timings.record('decode', time.perf_counter() - received_at)
+            if VERBOSE:
+                print(f"\n[Client: {sender_id}]: {data['message']}")
             
-            asyncio.create_task(self._handle_message(message, sender_id, participant))
+            # drops under a flood are counted in the scheduler stats rather than logged one by one
+            self.scheduler.submit(sender_id, (data['message'], participant, data['correlation_id'], received_at))
             
         except Exception as e:
             print(f"Error in data_received handler: {e}")
             import traceback
             traceback.print_exc()
     
-    async def _handle_message(self, message, sender_id, participant):
+    async def _send_to_caller(self, caller_id, message_type, text, request_id=None, correlation_id=None):
+        """Publish a message to one participant instead of the whole room"""
+        # a sender we couldn't identify can only be reached by a room-wide publish
+        destinations = [] if caller_id == "unknown" else [caller_id]
+        await self.room.local_participant.publish_data(
+            envelope.encode(message_type, text, request_id, correlation_id),
+            reliable=True,
+            destination_identities=destinations
+        )
+    
+    async def _process_message(self, sender_id, item):
+        """Scheduler handler for one queued message"""
+        message, participant, correlation_id, received_at = item
+        self.timings.record('queue', time.perf_counter() - received_at)
+        await self._handle_message(message, sender_id, participant, correlation_id, received_at)
+    
+    async def _handle_message(self, message, sender_id, participant, correlation_id=None, received_at=None):
         """Process message and send response to the same client"""
+        if received_at is None:
+            received_at = time.perf_counter()
+        request_id = None
         try:
-            answer = find_answer(message)
-            
-            if answer:
-                print(f"[AI Agent]: {answer}")
-                response = answer
-            else:
-                print(f"[AI Agent]: I'm not sure. Escalating to supervisor...")
-                try:
-                    request_id = str(uuid.uuid4())
-                    
-                    self.pending_help_requests[request_id] = sender_id
-                    print(f"Created help request {request_id} for caller {sender_id}")
-                    
-                    res = requests.post("http://localhost:5000/api/v1/helpreq", json={
-                        "question": message,
-                        "caller_id": sender_id,
-                        "request_id": request_id
-                    })
-                    print(f"[System]: Escalation created: {res.status_code}")
-                    
-                    if res.status_code == 201:
-                        try:
-                            api_request_id = res.json().get('id')
-                            if api_request_id and api_request_id != request_id:
-                                self.pending_help_requests[api_request_id] = sender_id
-                                print(f"Mapped DB ID {api_request_id} to caller {sender_id}")
-                        except:
-                            pass
-                    
-                    response = "I'm not sure about that. I've sent your question to a supervisor who will help you shortly."
-                except Exception as e:
-                    print(f"[System Error]: Failed to escalate: {e}")
-                    response = "I'm not sure about that, and I'm having trouble connecting to our help system. Please try again later."
+            with self.timings.time('match'):
+                answer = await find_answer_async(message)
             
-          
-            await asyncio.sleep(0.5)
+            if not answer:
+                if VERBOSE:
+                    print(f"[AI Agent]: I'm not sure. Escalating to supervisor...")
+                # the submission can take seconds; waiting for it here would hold a worker every other caller needs
+                record = self._escalate(message, sender_id, correlation_id)
+                self._queue_reply(sender_id, self._finish_escalation(record, sender_id, correlation_id, received_at))
+                return
             
-          
-            await self.room.local_participant.publish_data(response.encode('utf-8'))
+            if VERBOSE:
+                print(f"[AI Agent]: {answer}")
+            await self._reply_in_order(sender_id, self._reply(sender_id, envelope.ANSWER, answer, None,
+                                                              correlation_id, received_at))
                 
         except Exception as e:
             print(f"Error handling message: {e}")
+            self.outcomes[envelope.ERROR].inc()
             error_msg = f"Sorry, I encountered an error: {str(e)}"
-            await self.room.local_participant.publish_data(error_msg.encode('utf-8'))
+            await self._reply_in_order(sender_id, self._send_to_caller(sender_id, envelope.ERROR, error_msg,
+                                                                       request_id, correlation_id))
+    
+    async def _reply_in_order(self, sender_id, reply):
+        """Send reply (a coroutine) now, or after the caller's escalation acks still on their way"""
+        if sender_id in self._reply_tails:
+            self._queue_reply(sender_id, reply)
+        else:
+            await reply
+    
+    def _queue_reply(self, sender_id, reply):
+        """Send reply on its own task once the caller's earlier queued replies have gone"""
+        task = asyncio.create_task(self._reply_after(self._reply_tails.get(sender_id), reply))
+        self._reply_tails[sender_id] = task
+        task.add_done_callback(lambda task: self._reply_sent(sender_id, task))
+    
+    async def _reply_after(self, ahead, reply):
+        if ahead is not None:
+            await asyncio.wait([ahead])
+        try:
+            await reply
+        except Exception as e:
+            print(f"Error sending reply: {e}")
+    
+    def _reply_sent(self, sender_id, task):
+        if self._reply_tails.get(sender_id) is task:
+            del self._reply_tails[sender_id]
+    
+    def _escalate(self, message, sender_id, correlation_id):
+        """Register the caller on a help request for message, joining a pending one if there is one"""
+        # a question still waiting on a supervisor is not asked again, the caller joins it
+        record = self.pending_help_requests.find_question(normalize_question(message))
+        if record is None:
+            # callers asking the same question within the batch window share one help request
+            group = self.coalescer.add(message, sender_id, str(uuid.uuid4()))
+            record = self.pending_help_requests.get(group.request_id)
+            if record is None:
+                record = self.pending_help_requests.add(group.request_id, message, group.callers,
+                                                        group.key, group.submitted)
+                if VERBOSE:
+                    print(f"Created help request {record.request_id} for caller {sender_id}")
+        else:
+            if VERBOSE:
+                print(f"Added caller {sender_id} to pending help request {record.request_id}")
+        self.pending_help_requests.add_caller(record.request_id, sender_id, correlation_id)
+        return record
+    
+    async def _finish_escalation(self, record, sender_id, correlation_id, received_at):
+        """Wait for a help request to reach the backend, then tell the caller whether it did"""
+        request_id = record.request_id
+        try:
+            with self.timings.time('escalate'):
+                api_request_id = await record.submitted
+            if VERBOSE:
+                print(f"[System]: Escalation created: {api_request_id}")
+            
+            if self.pending_help_requests.alias(request_id, api_request_id):
+                if VERBOSE:
+                    print(f"Mapped DB ID {api_request_id} to callers {record.callers}")
+            
+            message_type = envelope.ESCALATION
+            response = "I'm not sure about that. I've sent your question to a supervisor who will help you shortly."
+        except EscalationError as e:
+            print(f"[System Error]: Failed to escalate: {e}")
+            self.pending_help_requests.pop(request_id)
+            message_type = envelope.ERROR
+            response = "I'm not sure about that, and I'm having trouble connecting to our help system. Please try again later."
+        try:
+            await self._reply(sender_id, message_type, response, request_id, correlation_id, received_at)
+        except Exception as e:
+            print(f"Error sending escalation reply: {e}")
+    
+    async def _reply(self, sender_id, message_type, response, request_id, correlation_id, received_at):
+        # pacing is opt-in per room, measured from arrival so it never adds to slow replies
+        hold = self.policy.min_reply_delay - (time.perf_counter() - received_at)
+        if hold > 0:
+            await asyncio.sleep(hold)
+        
+        with self.timings.time('publish'):
+            await self._send_to_caller(sender_id, message_type, response, request_id, correlation_id)
+        self.outcomes[message_type].inc()
+        if message_type == envelope.ANSWER:
+            self.timings.record('answered', time.perf_counter() - received_at)
     
     def _handle_participant_connected(self, *args):
         """Handle new participants joining"""
         try:
             participant = args[0]  
             participant_id = participant.identity if hasattr(participant, 'identity') else "unknown"
-            print(f"📞 Incoming call from: {participant_id}")
+            if VERBOSE:
+                print(f"📞 Incoming call from: {participant_id}")
             
           
             self.clients[participant_id] = participant
             
            
-            asyncio.create_task(self._send_welcome(0.5))
+            asyncio.create_task(self._send_welcome(participant_id, self.policy.welcome_delay))
         except Exception as e:
             print(f"Error in participant_connected handler: {e}")
     
@@ -229,28 +521,40 @@ class SalonAIAgent:
         try:
             participant = args[0]  
             participant_id = participant.identity if hasattr(participant, 'identity') else "unknown"
-            print(f"👋 Call ended with: {participant_id}")
+            if VERBOSE:
+                print(f"👋 Call ended with: {participant_id}")
             
             # removing from tracked clients
             if participant_id in self.clients:
                 del self.clients[participant_id]
+            
+            self.scheduler.forget(participant_id)
+            
+            # nobody is left to hear answers to requests only this caller was waiting on
+            evicted = self.pending_help_requests.drop_caller(participant_id)
+            if evicted:
+                print(f"Dropped {evicted} pending help requests for {participant_id}")
         except Exception as e:
             print(f"Error in participant_disconnected handler: {e}")
     
-    async def _send_welcome(self, delay=0):
-        """Send welcome message to room after optional delay"""
+    async def _send_welcome(self, participant_id, delay=0):
+        """Send welcome message to a new caller after optional delay"""
+        await self.ready.wait()
         if delay > 0:
             await asyncio.sleep(delay)
         welcome_msg = "Welcome to our salon! How can I help you today?"
-        await self.room.local_participant.publish_data(welcome_msg.encode('utf-8'))
+        await self._send_to_caller(participant_id, envelope.WELCOME, welcome_msg)
 
 
 
 async def main():
     print("===== Salon AI Agent with LiveKit =====")
+    start_matching_pool()  # forks the workers, so before LiveKit starts its threads
+    await serve_metrics()
     
     agent = SalonAIAgent()
     if await agent.connect():
+        signal_ready()
         try:
             await asyncio.Event().wait()  # will run until interrupted
         except KeyboardInterrupt:
@@ -265,6 +569,7 @@ async def cli_mode():
     
     caller_id = f"caller-{uuid.uuid4().hex[:6]}"
     print(f"Simulating caller: {caller_id}")
+    escalations = EscalationClient(max_in_flight=1)
     
     while True:
         user_input = input(f"\n[{caller_id}]: ")
@@ -276,13 +581,9 @@ async def cli_mode():
         else:
             print(f"[AI Agent]: I'm not sure. Escalating this to a supervisor...")
             try:
-                res = requests.post("http://localhost:5000/api/v1/helpreq", json={
-                    "question": user_input,
-                    "caller_id": caller_id,
-                    "request_id": str(uuid.uuid4())
-                })
+                res = await escalations.submit(user_input, caller_id, str(uuid.uuid4()))
                 print(f"[System]: Escalation created: {res.status_code}")
-            except Exception as e:
+            except EscalationError as e:
                 print(f"[System Error]: Failed to escalate: {e}")
 
 if __name__ == "__main__":
@@ -1,13 +1,14 @@
 import asyncio
+import json
 import sys
 import uuid
 from livekit import rtc
 from livekit.api import AccessToken, VideoGrants
 from config import HOST, API_KEY, API_SECRET, ROOM_NAME
 
-seen_messages = set()
-last_question = None
-welcome_shown = False
+import envelope
+
+last_question = None  # correlation id of the question we're waiting on
 
 async def test_client():
     room = rtc.Room()
@@ -37,11 +38,12 @@ async def test_client():
                 break
             
             global last_question
-            last_question = message
-            
-            seen_messages.add(message)
+            last_question = uuid.uuid4().hex
             
-            await room.local_participant.publish_data(message.encode('utf-8'))
+            await room.local_participant.publish_data(json.dumps({
+                "message": message,
+                "correlation_id": last_question
+            }).encode('utf-8'))
             
             for _ in range(5):  
                 await asyncio.sleep(0.5)
@@ -80,30 +82,19 @@ def data_received_handler(*args):
                   [attr for attr in dir(data_packet) if not attr.startswith('_')])
             return
         
-        message = data_bytes.decode('utf-8')
+        # the agent addresses messages to us only, so there's nothing to de-duplicate
+        data = envelope.decode(data_bytes)
+        message_type = data.get("type")
         
-        global welcome_shown
         global last_question
         
-        if message in seen_messages:
-            return
-            
-        if "Welcome to our salon" in message:
-            if not welcome_shown:
-                print(f"[Agent]: {message}")
-                welcome_shown = True
-            return
-        
-        if message.startswith("[Supervisor Answer]:"):
-            print(f"\n{message}")
-            last_question = None
-            return
+        if message_type == envelope.SUPERVISOR_ANSWER:
+            print(f"\n[Supervisor Answer]: {data['message']}")
+        else:
+            print(f"[Agent]: {data['message']}")
         
-        if last_question is not None:
-            print(f"[Agent]: {message}")
+        if data.get("correlation_id") == last_question:
             last_question = None
-        else:
-            print(f"[Agent]: {message}")
         
     except Exception as e:
         print(f"Error processing message: {str(e)}")
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from kb_store import KnowledgeBaseStore
+
+DEFAULT_CHUNK_SIZE = 64
+
+# set in the parent only while the workers fork, so they inherit the built index
+_preloaded = None
+# each worker's own store; it never polls the file, tasks say which version of the parent's to match against
+_store = None
+# the parent's snapshot the worker's store follows: the version it was loaded at, and the one it has reached
+_parent_loaded = None
+_parent_version = None
+
+
+def _init_worker(path):
+    global _store, _parent_loaded, _parent_version
+    _store = KnowledgeBaseStore(path, check_interval=float('inf'), snapshot=_preloaded)
+    if _preloaded is not None:
+        _parent_loaded, _parent_version = _preloaded.loaded_version, _preloaded.version
+
+
+def _snapshot_for(loaded, version, deltas=()):
+    """The worker's snapshot, first brought up to the parent's version"""
+    global _parent_loaded, _parent_version
+    if loaded == _parent_loaded and _parent_version is not None and version <= _parent_version:
+        return _store.current  # up to date (or a task queued before the parent's latest delta)
+    if loaded == _parent_loaded and _apply_deltas(version, deltas):
+        _parent_version = version
+    elif _store.refresh(force=True):
+        # the parent loaded another file, or we are too far behind its deltas; the backend
+        # writes the file before pushing, so reading it catches up with both
+        _parent_loaded, _parent_version = loaded, version
+        print(f"[match worker {os.getpid()}] reloaded knowledge base")
+    return _store.current
+
+
+def _apply_deltas(version, deltas):
+    """Apply the parent's deltas after ours up to version; False if they don't reach back that far"""
+    missing = [(v, delta) for v, delta in deltas if v > _parent_version]
+    if not missing or missing[0][0] != _parent_version + 1 or missing[-1][0] != version:
+        return False
+    try:
+        for _, delta in missing:
+            _store.apply_delta(delta)
+    except (KeyError, ValueError):
+        return False  # e.g. entries without ids; the reload replaces whatever was applied
+    return True
+
+
+def _match_batch(task, texts, mode, min_score):
+    snapshot = _snapshot_for(*task)
+    return [snapshot.answer(text, mode, min_score) for text in texts]
+
+
+def _worker_ready(task):
+    return os.getpid(), len(_snapshot_for(*task))
+
+
+def _task_for(snapshot):
+    """What a worker needs to follow snapshot: its load, its version and the deltas since the load"""
+    deltas = tuple(snapshot.deltas) if snapshot.version != snapshot.loaded_version else ()
+    return snapshot.loaded_version, snapshot.version, deltas
+
+
+class MatchingPool:
+    """Knowledge base lookups on a pool of worker processes.
+
+    Where fork is available the workers are forked after the parent has loaded
+    the knowledge base, so they start with the index already built and share
+    its pages copy-on-write. Every task says which of the parent's snapshots
+    to match against: the version it was loaded at, its current version and
+    the deltas applied since. A worker applies the deltas it hasn't seen and
+    reloads the file only when the parent has loaded a new one (or the
+    deltas it missed are no longer remembered), so once the parent has seen
+    a new file or applied a delta no worker answers from the previous
+    knowledge base.
+    """
+
+    def __init__(self, store, workers=None, mode="first", min_score=0.35):
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.min_score = min_score
+        self.executor = None
+
+    def start(self):
+        global _preloaded
+        if self.executor is not None:
+            return
+        snapshot = self.store.snapshot()
+        if self.mode == "ranked":
+            snapshot.ranker  # build it once here rather than in every worker
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+        _preloaded = snapshot
+        try:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=context,
+                                                initializer=_init_worker, initargs=(self.store.path,))
+            # fork every worker now, while the snapshot is in place and before other threads exist
+            list(self.executor.map(_worker_ready, [_task_for(snapshot)] * self.workers))
+        finally:
+            _preloaded = None
+        print(f"Matching pool ready: {self.workers} workers, {len(snapshot)} entries")
+
+    async def match(self, text):
+        return (await self.match_many([text]))[0]
+
+    async def match_many(self, texts, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Answers (or None) for each text, spread across the workers in chunks"""
+        task = _task_for(self.store.snapshot())
+        loop = asyncio.get_running_loop()
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, _match_batch, task, chunk, self.mode, self.min_score)
+            for chunk in chunks
+        ])
+        return [answer for chunk in results for answer in chunk]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,214 @@
+import time
+from contextlib import contextmanager
+
+
+class Histogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are recorded in whole microseconds. Below 64us every value has its
+    own bucket; above that each power of two is split into 32 buckets, so any
+    reported percentile is within about 3% of the true value. Recording is a
+    couple of integer operations and memory stays a few hundred counters.
+    """
+    SUB_BUCKETS = 32
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 6
+        return shift * cls.SUB_BUCKETS + (value >> shift)
+
+    @classmethod
+    def _upper_bound(cls, index):
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        mantissa = index - shift * cls.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        index = self._index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Value in seconds at percentile q (0-100)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * q / 100 + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self):
+        return self.total / self.count / 1e6 if self.count else 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max / 1000, 3)
+        }
+
+
+class Counter:
+    """A count that only goes up"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class MetricsRegistry:
+    """Named counters, histograms and gauges, rendered in the Prometheus text format.
+
+    Hot paths look their counter or histogram up once and keep the object, so
+    recording costs no more than Counter.inc or Histogram.record. Gauges are
+    functions called only when the metrics are scraped. Histograms are
+    exposed as summaries (p50/p90/p99 quantiles, sum and count) plus a _max.
+    """
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, prefix="salon_"):
+        self.prefix = prefix
+        self._metrics = {}  # name -> (kind, help, {labels: Counter / Histogram / function})
+
+    def _get(self, kind, name, help, labels, factory):
+        family = self._metrics.get(name)
+        if family is None:
+            family = self._metrics[name] = (kind, help, {})
+        elif family[0] != kind:
+            raise ValueError(f"metric {name} is already a {family[0]}")
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get('counter', name, help, labels, Counter)
+
+    def histogram(self, name, help="", **labels):
+        return self._get('summary', name, help, labels, Histogram)
+
+    def gauge(self, name, function, help="", **labels):
+        """Report function() as the gauge's value on every scrape"""
+        self._get('gauge', name, help, labels, lambda: function)
+        # registering again (a room's agent rejoined, say) replaces the old function
+        self._metrics[name][2][tuple(sorted(labels.items()))] = function
+
+    def render(self):
+        lines = []
+        for name, (kind, help, metrics) in self._metrics.items():
+            full_name = self.prefix + name
+            if help:
+                lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for key, metric in metrics.items():
+                if kind == 'counter':
+                    lines.append(f"{full_name}{_labels(key)} {metric.value}")
+                elif kind == 'gauge':
+                    try:
+                        value = metric()
+                    except Exception as e:
+                        print(f"Error reading gauge {name}: {e}")
+                        continue
+                    lines.append(f"{full_name}{_labels(key)} {value}")
+                else:
+                    for q in self.QUANTILES:
+                        lines.append(f"{full_name}{_labels(key + (('quantile', q),))} {metric.percentile(q * 100)}")
+                    lines.append(f"{full_name}_sum{_labels(key)} {metric.total / 1e6}")
+                    lines.append(f"{full_name}_count{_labels(key)} {metric.count}")
+            if kind == 'summary':
+                # a summary has no place for the maximum, so it is its own gauge
+                lines.append(f"# TYPE {full_name}_max gauge")
+                lines.extend(f"{full_name}_max{_labels(key)} {metric.max / 1e6}" for key, metric in metrics.items())
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# one registry per process, scraped through metrics_route()
+registry = MetricsRegistry()
+
+
+def metrics_route(server, path="/metrics"):
+    """Serve the registry from an http_api.HTTPServer"""
+    async def get_metrics(request):
+        return 200, registry.render(), "text/plain; version=0.0.4"
+    server.route("GET", path, get_metrics)
+
+
+class StageTimings:
+    """Latency histograms for the named stages of a pipeline, plus a p99 budget check.
+
+    With a registry, each stage's histogram is also exported as
+    <name>_<stage>_seconds with the given labels.
+    """
+
+    def __init__(self, budgets=None, registry=None, name="stage", **labels):
+        self.stages = {}
+        self.budgets = dict(budgets or {})  # stage -> p99 budget in seconds
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            if self.registry is not None:
+                histogram = self.registry.histogram(f"{self.name}_{stage}_seconds",
+                                                    f"{stage} latency", **self.labels)
+            else:
+                histogram = Histogram()
+            self.stages[stage] = histogram
+        histogram.record(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def over_budget(self):
+        """{stage: p99 seconds} for every stage whose p99 exceeds its budget"""
+        breaches = {}
+        for stage, budget in self.budgets.items():
+            histogram = self.stages.get(stage)
+            if histogram is not None and histogram.count and histogram.percentile(99) > budget:
+                breaches[stage] = histogram.percentile(99)
+        return breaches
+
+    def summary(self):
+        return {stage: histogram.summary() for stage, histogram in self.stages.items()}
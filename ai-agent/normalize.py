@@ -0,0 +1,24 @@
+import re
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s']+")
+_APOSTROPHE_RE = re.compile(r"'+")
+
+# filler words that don't change what a caller is asking; negations are kept on purpose
+STOP_WORDS = frozenset("""
+    a an the is are am was were be been do does did can could would will shall
+    i me my we our you your it its this that there please pls hi hello hey
+    to of for in on at by with about just so and or
+""".split())
+
+
+def normalize_question(text):
+    """Reduce a caller's question to a key shared by trivially different phrasings.
+
+    Lowercases, drops punctuation, collapses whitespace and removes stop words,
+    so "What are your hours?" and "what are  your hours" give the same key. If
+    nothing but stop words remain, the punctuation-free text is used instead.
+    """
+    text = _APOSTROPHE_RE.sub("", _PUNCTUATION_RE.sub(" ", text.lower()))
+    words = text.split()
+    kept = [w for w in words if w not in STOP_WORDS]
+    return " ".join(kept or words)
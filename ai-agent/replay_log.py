@@ -0,0 +1,74 @@
+import uuid
+from collections import deque
+
+DEFAULT_CAPACITY = 1000
+
+
+class ReplayLog:
+    """Numbered messages kept in a ring buffer so reconnecting clients can catch up.
+
+    Each appended message gets the next version number. A client that saw
+    version v asks for since(epoch, v) and gets every later message, or None
+    if the log can no longer say what it missed: the messages have been
+    overwritten, or the epoch differs because the server restarted. Such a
+    client has to resynchronise from scratch.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self._messages = deque(maxlen=capacity)
+
+    def append(self, message):
+        """Stamp message with the epoch and next version, keep it and return it"""
+        self.version += 1
+        message = dict(message, epoch=self.epoch, version=self.version)
+        self._messages.append(message)
+        return message
+
+    def since(self, epoch, version):
+        """Messages after version, or None if they can't all be replayed"""
+        if epoch != self.epoch or version is None or version > self.version:
+            return None
+        if version == self.version:
+            return []
+        oldest = self._messages[0]['version'] if self._messages else self.version + 1
+        if version + 1 < oldest:
+            return None
+        return [message for message in self._messages if message['version'] > version]
+
+
+class ReplayCursor:
+    """Client side of a ReplayLog: the last version seen, sent back as a resume token.
+
+    Messages the server replays after a reconnect can overlap what already
+    arrived, so accept() turns away any message at or below the version
+    already seen. Messages without a version (e.g. a resync from the server's
+    own state) are always accepted.
+    """
+
+    def __init__(self):
+        self.epoch = None
+        self.version = None
+        self.duplicates = 0
+
+    def token(self, prefix):
+        """Resume token fields for a hello message, e.g. prefix_epoch and prefix_version"""
+        return {f'{prefix}_epoch': self.epoch, f'{prefix}_version': self.version}
+
+    def accept(self, message):
+        """Advance past message; False if it was already seen"""
+        version = message.get('version')
+        if version is None:
+            return True
+        if message.get('epoch') == self.epoch and self.version is not None and version <= self.version:
+            self.duplicates += 1
+            return False
+        self.advance(message.get('epoch'), version)
+        return True
+
+    def advance(self, epoch, version):
+        """Everything up to version in epoch has been seen"""
+        if epoch != self.epoch or self.version is None or version > self.version:
+            self.epoch = epoch
+            self.version = version
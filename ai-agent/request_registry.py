@@ -0,0 +1,161 @@
+import time
+from collections import Counter, OrderedDict
+
+# the backend marks help requests UNRESOLVED after 24 hours, nobody answers them after that
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 10000
+
+
+class PendingRequest:
+    """One escalation waiting for a supervisor answer"""
+    __slots__ = ('request_id', 'backend_id', 'question', 'question_key', 'callers', 'correlation_ids',
+                 'submitted', 'created_at')
+
+    def __init__(self, request_id, question, callers, created_at, question_key=None, submitted=None):
+        self.request_id = request_id
+        self.backend_id = None
+        self.question = question
+        self.question_key = question_key  # normalized question, shared by repeats of it
+        self.submitted = submitted        # future resolving to the backend id once the POST is done
+        self.callers = callers
+        self.correlation_ids = {}  # caller_id -> id of the message that was escalated
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f"PendingRequest({self.request_id!r}, backend_id={self.backend_id!r}, callers={self.callers!r})"
+
+
+class RequestRegistry:
+    """Pending escalations, bounded by age and count.
+
+    Each escalation is stored once under the agent's request id; the backend's
+    id is an alias to the same record rather than a second entry, so either id
+    finds the request with one dict lookup and pop() clears both. Requests are
+    also indexed by normalized question, so a repeat of a question that is
+    still waiting on a supervisor joins the existing request. Records are kept
+    oldest first so expiry and size eviction only look at the front.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._records = OrderedDict()  # request_id -> PendingRequest, oldest first
+        self._aliases = {}             # backend id -> request_id
+        self._by_question = {}         # normalized question -> request_id
+        self._by_caller = {}           # caller_id -> set of request_ids
+        self.evictions = Counter()     # reason -> number of requests evicted
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records or key in self._aliases
+
+    def add(self, request_id, question, callers, question_key=None, submitted=None):
+        """Register an escalation for callers; later callers join with add_caller"""
+        # copied: drop_caller edits the record's list, which must not reach the caller's (e.g. a coalescer group's)
+        record = PendingRequest(request_id, question, list(callers), self.clock(), question_key, submitted)
+        self._records[request_id] = record
+        if question_key is not None:
+            self._by_question[question_key] = request_id
+        for caller_id in callers:
+            self._by_caller.setdefault(caller_id, set()).add(request_id)
+        self.prune()
+        return record
+
+    def add_caller(self, key, caller_id, correlation_id=None):
+        record = self.get(key)
+        if record is not None:
+            if caller_id not in record.callers:
+                record.callers.append(caller_id)
+            if correlation_id is not None:
+                record.correlation_ids[caller_id] = correlation_id
+            self._by_caller.setdefault(caller_id, set()).add(record.request_id)
+        return record
+
+    def alias(self, request_id, backend_id):
+        """Record the backend's id for a request so answers can be routed by either"""
+        record = self._records.get(request_id)
+        if record is not None and backend_id and backend_id != request_id:
+            record.backend_id = backend_id
+            self._aliases[backend_id] = request_id
+        return record
+
+    def get(self, key):
+        record = self._records.get(key)
+        if record is None and key in self._aliases:
+            record = self._records.get(self._aliases[key])
+        return record
+
+    def find_question(self, question_key):
+        """The pending request for a normalized question, if one is still waiting"""
+        request_id = self._by_question.get(question_key)
+        return self._records.get(request_id) if request_id is not None else None
+
+    def pop(self, key):
+        """Remove a request (by request id or backend id) and all of its aliases"""
+        record = self.get(key)
+        if record is None:
+            return None
+        del self._records[record.request_id]
+        if record.backend_id is not None:
+            self._aliases.pop(record.backend_id, None)
+        if record.question_key is not None and self._by_question.get(record.question_key) == record.request_id:
+            del self._by_question[record.question_key]
+        for caller_id in record.callers:
+            request_ids = self._by_caller.get(caller_id)
+            if request_ids is not None:
+                request_ids.discard(record.request_id)
+                if not request_ids:
+                    del self._by_caller[caller_id]
+        return record
+
+    def pop_any(self, *keys):
+        """Remove the request matching the first known key, exact matches only"""
+        for key in keys:
+            if key and key in self:
+                return self.pop(key)
+        return None
+
+    def drop_caller(self, caller_id):
+        """Forget a caller who hung up; requests nobody is waiting on any more are evicted"""
+        evicted = 0
+        for request_id in self._by_caller.pop(caller_id, ()):
+            record = self._records.get(request_id)
+            if record is None:
+                continue
+            if caller_id in record.callers:
+                record.callers.remove(caller_id)
+            record.correlation_ids.pop(caller_id, None)
+            if not record.callers:
+                self.pop(request_id)
+                evicted += 1
+        self.evictions['disconnected'] += evicted
+        return evicted
+
+    def prune(self):
+        """Evict expired requests, then the oldest ones while over max_size"""
+        expired_before = self.clock() - self.ttl
+        evicted = Counter()
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record.created_at < expired_before:
+                reason = 'expired'
+            elif len(self._records) > self.max_size:
+                reason = 'size'
+            else:
+                break
+            self.pop(record.request_id)
+            evicted[reason] += 1
+        if evicted:
+            self.evictions.update(evicted)
+            print(f"Evicted pending help requests: {dict(evicted)}")
+        return sum(evicted.values())
+
+    def stats(self):
+        return {
+            'pending': len(self._records),
+            'aliases': len(self._aliases),
+            'evictions': dict(self.evictions)
+        }
@@ -0,0 +1,137 @@
+"""Run the salon agent for many LiveKit rooms, sharded across processes.
+
+Rooms come from ROOM_NAMES in config.py (default: just ROOM_NAME) and are
+assigned to shards by a stable hash of the room name, so a room always lands
+in the same process. Each shard joins all of its rooms from one event loop
+and shares one knowledge base, one escalation client and one backend
+connection between them; callers and pending help requests stay per room.
+
+    python runtime.py --shards 4            # fork one process per shard
+    python runtime.py --shards 4 --shard 2  # run a single shard, e.g. under a supervisor
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import zlib
+
+import config
+from agent import kb_sync, start_matching_pool
+from escalation import EscalationClient
+from livekit_agent import (BACKEND_AGENT_ID, METRICS_PORT, READY_FILE, SalonAIAgent, follow_backend_updates,
+                           serve_metrics, signal_ready)
+
+ROOM_NAMES = getattr(config, "ROOM_NAMES", [config.ROOM_NAME])
+SHARDS = getattr(config, "SHARDS", 1)
+JOIN_CONCURRENCY = 20  # rooms a shard joins at once while starting up
+JOIN_RETRY_INTERVAL = 30  # seconds before retrying a room that failed to join
+
+
+def shard_for(room_name, shards):
+    """Stable shard number for a room"""
+    return zlib.crc32(room_name.encode('utf-8')) % shards
+
+
+def rooms_for_shard(room_names, shard, shards):
+    return [name for name in room_names if shard_for(name, shards) == shard]
+
+
+class AgentRuntime:
+    """One SalonAIAgent per room, all on this process's event loop"""
+
+    def __init__(self, room_names):
+        self.room_names = list(room_names)
+        self.escalations = EscalationClient(agent_id=BACKEND_AGENT_ID)
+        self.agents = {}  # room_name -> SalonAIAgent, once joined
+
+    def _new_agent(self, room_name):
+        return SalonAIAgent(room_name, escalations=self.escalations, follow_backend=False)
+
+    async def start(self):
+        join_slots = asyncio.Semaphore(JOIN_CONCURRENCY)
+
+        async def join(room_name):
+            async with join_slots:
+                agent = self._new_agent(room_name)
+                if await agent.connect():
+                    self.agents[room_name] = agent
+                else:
+                    asyncio.create_task(self._keep_joining(room_name))
+
+        await asyncio.gather(*[join(name) for name in self.room_names])
+        print(f"Serving {len(self.agents)} of {len(self.room_names)} rooms")
+        asyncio.create_task(follow_backend_updates(self._dispatch_backend_update))
+
+    async def _keep_joining(self, room_name):
+        """Retry a room that failed to join, with a fresh agent each time"""
+        while room_name not in self.agents:
+            await asyncio.sleep(JOIN_RETRY_INTERVAL)
+            agent = self._new_agent(room_name)
+            if await agent.connect():
+                self.agents[room_name] = agent
+
+    async def _dispatch_backend_update(self, message):
+        """Hand a help request update to the room that raised the request"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            print(f"Ignoring malformed backend message: {message!r}")
+            return
+        if not isinstance(data, dict) or kb_sync.handle(data):
+            return
+        for agent in self.agents.values():
+            if agent.is_waiting_on(data):
+                await agent._handle_websocket_message(message)
+                return
+
+    async def run(self, ready_file=None, metrics_port=None):
+        await serve_metrics(metrics_port)
+        await self.start()
+        signal_ready(ready_file)
+        await asyncio.Event().wait()  # will run until interrupted
+
+
+def run_shard(shard, shards, room_names):
+    rooms = rooms_for_shard(room_names, shard, shards)
+    if not rooms:
+        print(f"Shard {shard}/{shards} has no rooms")
+        return
+    print(f"===== Shard {shard}/{shards}: {len(rooms)} rooms =====")
+    start_matching_pool()  # forks the workers, so before LiveKit starts its threads
+    ready_file = READY_FILE if shards == 1 or not READY_FILE else f"{READY_FILE}.{shard}"
+    try:
+        # one metrics port per shard, counting up from METRICS_PORT
+        metrics_port = METRICS_PORT + shard if METRICS_PORT else None
+        asyncio.run(AgentRuntime(rooms).run(ready_file, metrics_port))
+    except KeyboardInterrupt:
+        print(f"\nShard {shard} stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=SHARDS, help="number of processes to spread rooms over")
+    parser.add_argument("--shard", type=int, default=None, help="run only this shard in the current process")
+    args = parser.parse_args()
+
+    if args.shard is not None:
+        run_shard(args.shard, args.shards, ROOM_NAMES)
+        return
+    if args.shards == 1:
+        run_shard(0, 1, ROOM_NAMES)
+        return
+
+    # spawn rather than fork: each shard starts its own LiveKit runtime from scratch
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_shard, args=(shard, args.shards, ROOM_NAMES), name=f"shard-{shard}")
+                 for shard in range(args.shards)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\nAgent runtime stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+from collections import Counter, deque
+
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 20       # messages waiting per caller
+DEFAULT_MAX_PENDING = 1000    # messages waiting across all callers
+
+DROP_NEWEST = "drop_newest"   # refuse the incoming message
+DROP_OLDEST = "drop_oldest"   # make room by discarding the caller's oldest waiting message
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST)
+
+
+class CallerScheduler:
+    """Per-caller FIFO queues served round-robin by a fixed pool of workers.
+
+    A caller is handed to at most one worker at a time, so each caller's
+    messages are handled in the order they arrived. A worker takes one message
+    per turn and then puts the caller at the back of the ready queue, so a
+    flooding caller only ever gets its share of the workers while everyone
+    else keeps being served.
+    """
+
+    def __init__(self, handler, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_pending=DEFAULT_MAX_PENDING, overflow=DROP_OLDEST):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.handler = handler          # coroutine function (caller_id, item)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.dropped = Counter()        # reason -> messages dropped
+        self.handled = 0
+        self._queues = {}               # caller_id -> deque of waiting items
+        self._scheduled = set()         # callers that are in the ready queue or being handled
+        self._ready = asyncio.Queue()   # callers with work, in round-robin order
+        self._pending = 0
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, caller_id, item):
+        """Queue an item for a caller; returns False if it was dropped"""
+        queue = self._queues.get(caller_id)
+        if queue is None:
+            queue = self._queues[caller_id] = deque()
+
+        if len(queue) >= self.queue_size:
+            if self.overflow == DROP_NEWEST:
+                self.dropped['caller_queue_full'] += 1
+                return False
+            queue.popleft()
+            self._pending -= 1
+            self.dropped['caller_queue_full'] += 1
+        elif self._pending >= self.max_pending:
+            self.dropped['global_queue_full'] += 1
+            return False
+
+        queue.append(item)
+        self._pending += 1
+        if caller_id not in self._scheduled:
+            self._scheduled.add(caller_id)
+            self._ready.put_nowait(caller_id)
+        return True
+
+    def forget(self, caller_id):
+        """Discard everything still waiting for a caller who left"""
+        queue = self._queues.get(caller_id)
+        if not queue:
+            return 0
+        discarded = len(queue)
+        queue.clear()
+        self._pending -= discarded
+        self.dropped['disconnected'] += discarded
+        return discarded
+
+    async def _worker(self):
+        while True:
+            caller_id = await self._ready.get()
+            queue = self._queues.get(caller_id)
+            if queue:
+                item = queue.popleft()
+                self._pending -= 1
+                try:
+                    await self.handler(caller_id, item)
+                except Exception as e:
+                    print(f"Error handling message from {caller_id}: {e}")
+                    import traceback
+                    traceback.print_exc()
+                self.handled += 1
+
+            if queue:
+                self._ready.put_nowait(caller_id)
+            else:
+                self._scheduled.discard(caller_id)
+                self._queues.pop(caller_id, None)
+
+    def stats(self):
+        return {
+            'workers': len(self._tasks),
+            'callers': len(self._queues),
+            'pending': self._pending,
+            'handled': self.handled,
+            'dropped': dict(self.dropped)
+        }
@@ -2,28 +2,78 @@ import asyncio
 import websockets
 import json
 from datetime import datetime
-import http.server
-import socketserver
-import threading
 
-help_requests = {}
+from fanout import FanOut
+from help_request_log import HelpRequestLog
+from help_request_store import HelpRequestStore
+from http_api import HTTPServer, HTTPError
+from metrics import metrics_route, registry
+from replay_log import ReplayLog
+
+# optional settings, shared with the agent's config.py when there is one
+try:
+    import config
+except ImportError:
+    config = None
+
+help_requests = HelpRequestStore()
+# journal that lets pending help requests survive a restart; None keeps them in memory only
+HELP_REQUEST_LOG = "help_requests.log"
+help_request_log = HelpRequestLog(HELP_REQUEST_LOG) if HELP_REQUEST_LOG else None
+# knowledge base changes from the backend, kept so reconnecting agents can catch up
+kb_deltas = ReplayLog()
+KB_DELTA_OPS = ('upsert', 'delete')
+# help request updates, kept so agents that reconnect get the answers they missed
+help_updates = ReplayLog(capacity=10000)
+# protocol-level pings; an agent that doesn't answer within the timeout is dropped
+PING_INTERVAL = 10  # seconds
+PING_TIMEOUT = 10
+# messages published to a new connection wait this long for its hello, then go out as they are
+HELLO_TIMEOUT = 2  # seconds
+# per-message prints (supervisor messages, broadcasts, HTTP requests); errors are always printed
+VERBOSE = getattr(config, "VERBOSE", True)
+# /metrics gets its own listener on localhost rather than the API's public bind; None disables it
+SERVER_METRICS_PORT = getattr(config, "SERVER_METRICS_PORT", 9107)
 
 class WebSocketServer:
     def __init__(self):
-        self.agent_connections = set()
+        # every agent connection gets its own outbound queue and sender task
+        self.agents = FanOut()
         self.supervisor_connections = set()
     
     async def agent_handler(self, websocket):
         """Handle connections from the AI agent"""
         print(f"Agent connected from {websocket.remote_address}")
-        self.agent_connections.add(websocket)
+        # held until the hello: a live update sent ahead of the replay would pass the ones it replays
+        subscriber = self.agents.subscribe(websocket, hold=True)
+        release = asyncio.get_running_loop().call_later(HELLO_TIMEOUT, subscriber.release)
         try:
             async for message in websocket:
-                pass
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    print(f"Ignoring malformed agent message: {message!r}")
+                    continue
+                if not isinstance(data, dict):
+                    print(f"Ignoring agent message that is not an object: {message!r}")
+                    continue
+                if data.get('type') == 'hello':
+                    # updates for help requests this agent raised go only to it
+                    subscriber.agent_id = data.get('agent_id')
+                    self.sync_agent_kb(subscriber, data)
+                    replayed = self.sync_agent_updates(subscriber, data)
+                    release.cancel()
+                    subscriber.release(replayed)
+                elif data.get('type') == 'ping':
+                    # application-level liveness check for clients that can't send protocol pings
+                    subscriber.enqueue(json.dumps({'type': 'pong', 'id': data.get('id')}), force=True)
+                elif VERBOSE:
+                    print(f"Ignoring agent message of type {data.get('type')!r}")
         except Exception as e:
             print(f"Error with agent connection: {e}")
         finally:
-            self.agent_connections.remove(websocket)
+            release.cancel()
+            self.agents.unsubscribe(websocket)
             print("Agent disconnected")
     
     async def supervisor_handler(self, websocket):
@@ -34,30 +84,37 @@ class WebSocketServer:
             async for message in websocket:
                 try:
                     data = json.loads(message)
-                    print(f"Received from supervisor: {data}")
+                    if VERBOSE:
+                        print(f"Received from supervisor: {data}")
                     
                     if data.get('type') == 'answer_help_request' or data.get('type') == 'resolve':
                         request_id = data.get('request_id')
+                        request_id = str(request_id) if request_id is not None else None
                         answer = data.get('answer')
                         
                         if request_id and answer:
-                            if request_id in help_requests:
-                                help_requests[request_id]['status'] = 'answered'
-                                help_requests[request_id]['answer'] = answer
+                            help_requests.update(request_id, status='answered', answer=answer)
                             
-                            print(f"Broadcasting help request update: {request_id}")
-                            await self.broadcast_to_agents({
+                            if VERBOSE:
+                                print(f"Broadcasting help request update: {request_id}")
+                            update = {
                                 'type': 'help_request_update',
                                 'request_id': request_id,
                                 'status': 'answered',
                                 'answer': answer
-                            })
+                            }
+                            if data.get('db_id'):
+                                update['db_id'] = data['db_id']
+                            self.publish_help_update(update)
                             
                             await websocket.send(json.dumps({
                                 'type': 'answer_confirmed',
                                 'request_id': request_id
                             }))
                     
+                    elif data.get('type') == 'kb_delta':
+                        self.publish_kb_delta(data)
+                    
                 except Exception as e:
                     print(f"Error processing supervisor message: {e}")
                     import traceback
@@ -68,88 +125,219 @@ class WebSocketServer:
             self.supervisor_connections.remove(websocket)
             print("Supervisor disconnected")
     
-    async def broadcast_to_agents(self, data):
-        """Send a message to all connected agents"""
-        if self.agent_connections:
-            message = json.dumps(data)
-            print(f"Broadcasting to {len(self.agent_connections)} agents: {message}")
-            await asyncio.gather(*[conn.send(message) for conn in self.agent_connections])
-        else:
-            print("No agents connected to broadcast to")
-
-class APIHandler(http.server.SimpleHTTPRequestHandler):
-    def do_POST(self):
-        if self.path == "/api/v1/helpreq":
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            request_id = data.get('request_id', str(datetime.now().timestamp()))
-            help_requests[request_id] = {
-                'question': data.get('question', ''),
-                'caller_id': data.get('caller_id', 'unknown'),
-                'status': 'pending',
-                'created_at': datetime.now().isoformat()
-            }
-            
-            self.send_response(201)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'request_id': request_id,
-                'status': 'created',
-                'id': request_id  
-            }).encode('utf-8'))
-            
-            asyncio.run_coroutine_threadsafe(
-                ws_server.broadcast_to_agents({
-                    'type': 'new_help_request',
-                    'request_id': request_id,
-                    'question': data.get('question', ''),
-                    'caller_id': data.get('caller_id', 'unknown')
-                }),
-                loop
-            )
+    def sync_agent_kb(self, subscriber, data):
+        """Replay the knowledge base deltas an agent missed, or tell it to reload the file"""
+        # queued ahead of any later delta, and past the queue bound since the agent asked for them
+        missed = kb_deltas.since(data.get('kb_epoch'), data.get('kb_version'))
+        if missed is None:
+            print(f"Agent at KB version {data.get('kb_version')} must resync to {kb_deltas.version}")
+            subscriber.enqueue(json.dumps({
+                'type': 'kb_reset',
+                'epoch': kb_deltas.epoch,
+                'version': kb_deltas.version
+            }), force=True)
             return
-        
-        self.send_response(404)
-        self.end_headers()
+        for delta in missed:
+            subscriber.enqueue(json.dumps(delta), force=True)
+    
+    def sync_agent_updates(self, subscriber, data):
+        """Replay the help request updates an agent missed, then tell it where the stream is.
+
+        Returns whether the agent now has every numbered update meant for it.
+        """
+        epoch, version = data.get('updates_epoch'), data.get('updates_version')
+        first_hello = version is None
+        if first_hello:
+            if not subscriber.agent_id:
+                return False  # nothing to resume from, nor to pick its updates by
+            # it may have escalated before connecting, so it gets whatever is still buffered for it
+            epoch, version = help_updates.epoch, 0
+        missed = help_updates.since(epoch, version)
+        if missed is not None:
+            for update in missed:
+                owner = update.get('agent_id')
+                if owner == subscriber.agent_id if first_hello else subscriber.wants(owner):
+                    subscriber.enqueue(json.dumps(update), force=True)
+        elif subscriber.agent_id:
+            # the updates are gone (overwritten, or we restarted), but the store knows what was answered
+            print(f"Agent {subscriber.agent_id} at update {version} can't be replayed, resending its answers")
+            for request_id, record in help_requests.as_dict().items():
+                if record.get('agent_id') == subscriber.agent_id and record.get('status') == 'answered':
+                    subscriber.enqueue(json.dumps({
+                        'type': 'help_request_update',
+                        'request_id': request_id,
+                        'status': 'answered',
+                        'answer': record.get('answer'),
+                        'resync': True
+                    }), force=True)
+        subscriber.enqueue(json.dumps({
+            'type': 'help_updates_synced',
+            'epoch': help_updates.epoch,
+            'version': help_updates.version
+        }), force=True)
+        return True
     
-    def do_GET(self):
-        if self.path == "/api/v1/helpreq":
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(help_requests).encode('utf-8'))
+    def publish_help_update(self, update):
+        """Number a help request update and push it to the agent that raised the request"""
+        owner = request_owner(update['request_id'])
+        if owner is not None:
+            update['agent_id'] = owner  # replays go to the owner only
+        self.broadcast_to_agents(help_updates.append(update), owner=owner)
+    
+    def publish_kb_delta(self, data):
+        """Number a knowledge base change from the backend and push it to every agent"""
+        op = data.get('op')
+        if op not in KB_DELTA_OPS:
+            print(f"Ignoring knowledge base delta with op {op!r}")
+            return
+        delta = {'type': 'kb_delta', 'op': op}
+        if op == 'upsert':
+            if not isinstance(data.get('entry'), dict) or not data['entry'].get('id'):
+                print(f"Ignoring knowledge base upsert without an entry id: {data}")
+                return
+            delta['entry'] = data['entry']
+        else:
+            delta['id'] = data.get('id')
+        self.broadcast_to_agents(kb_deltas.append(delta))
+    
+    def broadcast_to_agents(self, data, owner=None):
+        """Queue a message for all connected agents, or only the owner's if it is connected"""
+        if not self.agents:
+            if VERBOSE:
+                print("No agents connected to broadcast to")
+            broadcasts_unheard.inc()
             return
-            
-        self.send_response(404)
-        self.end_headers()
+        if owner is not None and not any(s.agent_id == owner for s in self.agents.subscribers.values()):
+            owner = None  # the owner reconnected under a new id or never said hello, let everyone check
+        delivered = self.agents.publish(data, owner)
+        if VERBOSE:
+            print(f"Queued {data.get('type')} for {delivered} of {len(self.agents)} agents")
+
+def request_owner(request_id):
+    """Agent that raised a help request, if it told us"""
+    record = help_requests.get(request_id)
+    return record.get('agent_id') if record else None
+
+def create_help_request(data):
+    """Store one help request and tell the agents about it"""
+    request_id = data.get('request_id')
+    # ids are strings everywhere else (the journal, answer routing), whatever the client sent
+    request_id = str(datetime.now().timestamp()) if request_id is None else str(request_id)
+    extra = {'caller_ids': list(data['caller_ids'])} if data.get('caller_ids') else {}
+    if data.get('agent_id'):
+        extra['agent_id'] = data['agent_id']
+    help_requests.add(request_id, data.get('question', ''), data.get('caller_id', 'unknown'), **extra)
+
+    # same loop as the websocket servers, so no cross-thread hop is needed
+    ws_server.broadcast_to_agents({
+        'type': 'new_help_request',
+        'request_id': request_id,
+        'question': data.get('question', ''),
+        'caller_id': data.get('caller_id', 'unknown')
+    }, owner=extra.get('agent_id'))
+    return {
+        'request_id': request_id,
+        'status': 'created',
+        'id': request_id
+    }
 
-    def log_message(self, format, *args):
-        print(f"[HTTP] {self.client_address[0]} - {format % args}")
+async def post_help_request(request):
+    data = request.json()
+    if not isinstance(data, dict):
+        raise HTTPError(400, 'Expected a help request object')
+    return 201, create_help_request(data)
+
+async def post_help_request_batch(request):
+    data = request.json()
+    if isinstance(data, dict):
+        data = data.get('requests', [])
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise HTTPError(400, 'Expected a list of help requests')
+    return 201, [create_help_request(item) for item in data]
+
+QUERY_PARAMS = ('status', 'caller_id', 'created_after', 'created_before', 'cursor', 'since', 'limit')
+
+async def get_help_requests(request):
+    """List help requests; any query parameter switches to the paginated response"""
+    if not request.query:
+        return 200, help_requests.as_dict()
+
+    unknown = set(request.query) - set(QUERY_PARAMS)
+    if unknown:
+        raise HTTPError(400, f"Unknown query parameters: {', '.join(sorted(unknown))}")
+    try:
+        return 200, help_requests.query(**request.query)
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid query parameter: {e}")
+
+async def get_help_request_stats(request):
+    return 200, help_requests.stats()
 
 ws_server = WebSocketServer()
 
-async def start_websocket_server():
-    agent_server = await websockets.serve(ws_server.agent_handler, "localhost", 8765)
+broadcasts_unheard = registry.counter("ws_broadcasts_unheard_total", "Messages published with no agent connected")
+registry.gauge("ws_agent_connections", lambda: len(ws_server.agents), "Connected agents")
+registry.gauge("ws_supervisor_connections", lambda: len(ws_server.supervisor_connections), "Connected supervisors")
+registry.gauge("ws_queued_messages", lambda: ws_server.agents.stats()['queued'], "Messages waiting in agent send queues")
+registry.gauge("ws_dropped_messages", lambda: ws_server.agents.stats()['dropped'],
+               "Messages dropped by connected agents' full send queues")
+registry.gauge("ws_slow_disconnects", lambda: ws_server.agents.disconnected_slow,
+               "Agents disconnected for falling behind")
+registry.gauge("help_requests", lambda: len(help_requests), "Help requests held in memory")
+registry.gauge("kb_delta_version", lambda: kb_deltas.version, "Knowledge base deltas published since start")
+registry.gauge("help_update_version", lambda: help_updates.version, "Help request updates published since start")
+if help_request_log is not None:
+    registry.gauge("help_request_log_queued", lambda: help_request_log.stats()['queued'],
+                   "Help request changes waiting to be written to the log")
+
+api_server = HTTPServer(log_requests=VERBOSE)
+metrics_server = HTTPServer("metrics", log_requests=False)
+metrics_route(metrics_server)
+api_server.route("POST", "/api/v1/helpreq", post_help_request)
+api_server.route("POST", "/api/v1/helpreq/batch", post_help_request_batch)
+api_server.route("GET", "/api/v1/helpreq", get_help_requests)
+api_server.route("GET", "/api/v1/helpreq/stats", get_help_request_stats)
+
+PRUNE_INTERVAL = 60  # seconds between retention sweeps
+
+async def prune_help_requests():
+    """Evict expired help requests even when no new ones are arriving"""
+    while True:
+        await asyncio.sleep(PRUNE_INTERVAL)
+        evicted = help_requests.prune()
+        if evicted:
+            print(f"Evicted {evicted} help requests: {help_requests.stats()['evictions']}")
+        if help_request_log is not None:
+            help_request_log.compact(help_requests)
+
+async def start_servers():
+    if help_request_log is not None:
+        help_request_log.open(help_requests)
+    http_server = await api_server.start("", 5000)
+    print("HTTP server started on port 5000")
+    servers = [http_server.serve_forever()]
+    if SERVER_METRICS_PORT:
+        listener = await metrics_server.start("127.0.0.1", SERVER_METRICS_PORT)
+        print(f"Metrics on http://127.0.0.1:{SERVER_METRICS_PORT}/metrics")
+        servers.append(listener.serve_forever())
+
+    agent_server = await websockets.serve(ws_server.agent_handler, "localhost", 8765,
+                                          ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT)
     supervisor_server = await websockets.serve(ws_server.supervisor_handler, "localhost", 8766)
     print("WebSocket servers started on ports 8765 (agent) and 8766 (supervisor)")
     
     await asyncio.gather(
+        prune_help_requests(),
+        *servers,
         agent_server.wait_closed(),
         supervisor_server.wait_closed()
     )
 
-def start_http_server():
-    httpd = socketserver.TCPServer(("", 5000), APIHandler)
-    print("HTTP server started on port 5000")
-    httpd.serve_forever()
-
 if __name__ == "__main__":
-    http_thread = threading.Thread(target=start_http_server)
-    http_thread.daemon = True
-    http_thread.start()
-    
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(start_websocket_server())
\ No newline at end of file
+    try:
+        asyncio.run(start_servers())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if help_request_log is not None:
+            help_request_log.close()
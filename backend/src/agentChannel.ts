@@ -0,0 +1,51 @@
+import WebSocket from "ws";
+
+const AGENT_CHANNEL_URL = "ws://localhost:8766";
+const RECONNECT_DELAY_MS = 2000;
+const MAX_QUEUED_MESSAGES = 1000;
+
+// one long-lived connection to ws_server, so messages reach it in the order they were sent
+let socket: WebSocket | null = null;
+let reconnectTimer: NodeJS.Timeout | null = null;
+const queue: string[] = [];
+
+const flush = () => {
+  while (socket && socket.readyState === WebSocket.OPEN && queue.length > 0) {
+    socket.send(queue.shift() as string);
+  }
+};
+
+const connect = () => {
+  if (socket || reconnectTimer) {
+    return;
+  }
+  const ws = new WebSocket(AGENT_CHANNEL_URL);
+  socket = ws;
+
+  ws.on("open", flush);
+
+  ws.on("close", () => {
+    socket = null;
+    if (queue.length > 0) {
+      reconnectTimer = setTimeout(() => {
+        reconnectTimer = null;
+        connect();
+      }, RECONNECT_DELAY_MS);
+    }
+  });
+
+  ws.on("error", (error: Error) => {
+    console.error("Agent channel error:", error.message);
+  });
+};
+
+export const sendToAgents = (message: object) => {
+  if (queue.length >= MAX_QUEUED_MESSAGES) {
+    // the change is still in the knowledge base file, which agents reload when they resync
+    console.error("Agent channel queue full, dropping oldest message");
+    queue.shift();
+  }
+  queue.push(JSON.stringify(message));
+  connect();
+  flush();
+};
@@ -1,6 +1,7 @@
 import { Request, Response } from "express";
 import { db } from "../db";
 import WebSocket from "ws";
+import { publishKnowledgeUpsert, syncKnowledgeBaseToJson } from "./knowledge.controller";
 
 const HELP_REQUEST_TIMEOUT_MS = 24 * 60 * 60 * 1000; 
 
@@ -57,6 +58,42 @@ export const helpRequests = async (req: Request, res: Response) => {
   return;
 };
 
+export const batchHelpRequests = async (req: Request, res: Response) => {
+  const items = Array.isArray(req.body) ? req.body : req.body?.requests;
+  if (!Array.isArray(items) || items.length === 0) {
+    res.status(400).json({
+      error: "An array of help requests is required",
+    });
+    return;
+  }
+  if (items.some((item: any) => !item || !item.question)) {
+    res.status(400).json({
+      error: "Question is required",
+    });
+    return;
+  }
+
+  const created = await db.$transaction(
+    items.map((item: any) =>
+      db.helpRequest.create({
+        data: {
+          question: item.question,
+          caller_id: item.caller_id || "anonymous",
+          request_id: item.request_id || undefined,
+        },
+      })
+    )
+  );
+
+  res.status(201).json(
+    created.map((helpRequest, index) => ({
+      ...helpRequest,
+      request_id: helpRequest.request_id || items[index].request_id || helpRequest.id,
+    }))
+  );
+  return;
+};
+
 export const getHelpRequests = async (req: Request, res: Response) => {
   await checkTimeoutRequests();
   
@@ -132,8 +169,7 @@ if (status === "RESOLVED") {
     });
     
     try {
-      const { getKnowledgeBase, addKnowledgeEntry } = require('../controllers/knowledge.controller');
-      await db.knowledgeBaseEntry.upsert({
+      const entry = await db.knowledgeBaseEntry.upsert({
         where: {
           question: helpRequest.question
         },
@@ -147,17 +183,8 @@ if (status === "RESOLVED") {
         }
       });
       
-      const fs = require('fs').promises;
-      const path = require('path');
-      
-      const entries = await db.knowledgeBaseEntry.findMany();
-      const formattedEntries = entries.map(entry => ({
-        question: entry.question,
-        answer: entry.answer
-      }));
-      
-      const KNOWLEDGE_BASE_PATH = path.resolve(__dirname, '../../../ai-agent/knowledge_base.json');
-      await fs.writeFile(KNOWLEDGE_BASE_PATH, JSON.stringify(formattedEntries, null, 2), 'utf-8');
+      await syncKnowledgeBaseToJson();
+      publishKnowledgeUpsert(entry);
       
       console.log(`✅ Knowledge base updated with answer to "${helpRequest.question}"`);
     } catch (kbError) {
@@ -2,15 +2,17 @@ import { Request, Response } from "express";
 import { db } from "../db";
 import fs from 'fs/promises';
 import path from 'path';
+import { sendToAgents } from '../agentChannel';
 
 const KNOWLEDGE_BASE_PATH = path.resolve(__dirname, '../../../ai-agent/knowledge_base.json');
 
 console.log('Knowledge base path:', KNOWLEDGE_BASE_PATH);
 
-const syncKnowledgeBaseToJson = async () => {
+export const syncKnowledgeBaseToJson = async () => {
   try {
     const entries = await db.knowledgeBaseEntry.findMany();
     const formattedEntries = entries.map(entry => ({
+      id: entry.id,
       question: entry.question,
       answer: entry.answer
     }));
@@ -24,6 +26,19 @@ const syncKnowledgeBaseToJson = async () => {
   }
 };
 
+// pushes one change to the agents; call after syncKnowledgeBaseToJson so the file already has it
+export const publishKnowledgeUpsert = (entry: { id: string; question: string; answer: string }) => {
+  sendToAgents({
+    type: 'kb_delta',
+    op: 'upsert',
+    entry: { id: entry.id, question: entry.question, answer: entry.answer }
+  });
+};
+
+export const publishKnowledgeDelete = (id: string) => {
+  sendToAgents({ type: 'kb_delta', op: 'delete', id });
+};
+
 export const testKnowledgeRoute = (req: Request, res: Response) => {
   try {
     console.log('Test knowledge route accessed');
@@ -97,6 +112,7 @@ export const addKnowledgeEntry = async (req: Request, res: Response) => {
     });
     
     await syncKnowledgeBaseToJson();
+    publishKnowledgeUpsert(newEntry);
     
     res.status(201).json(newEntry);
   } catch (error) {
@@ -140,6 +156,7 @@ export const updateKnowledgeEntry = async (req: Request, res: Response) => {
     });
     
     await syncKnowledgeBaseToJson();
+    publishKnowledgeUpsert(updatedEntry);
     
     res.status(200).json(updatedEntry);
   } catch (error) {
@@ -194,6 +211,7 @@ export const addFromHelpRequest = async (req: Request, res: Response) => {
     });
     
     await syncKnowledgeBaseToJson();
+    publishKnowledgeUpsert(newEntry);
     
     res.status(201).json(newEntry);
   } catch (error) {
@@ -203,4 +221,36 @@ export const addFromHelpRequest = async (req: Request, res: Response) => {
     });
     return;
   }
-};
\ No newline at end of file
+};
+
+export const deleteKnowledgeEntry = async (req: Request, res: Response) => {
+  const { id } = req.params;
+  
+  try {
+    const existingEntry = await db.knowledgeBaseEntry.findUnique({
+      where: { id }
+    });
+    
+    if (!existingEntry) {
+      res.status(404).json({
+        error: "Knowledge entry not found",
+      });
+      return;
+    }
+    
+    await db.knowledgeBaseEntry.delete({
+      where: { id }
+    });
+    
+    await syncKnowledgeBaseToJson();
+    publishKnowledgeDelete(id);
+    
+    res.status(204).end();
+  } catch (error) {
+    console.error('Failed to delete knowledge base entry:', error);
+    res.status(500).json({
+      error: "Failed to delete knowledge base entry",
+    });
+    return;
+  }
+};
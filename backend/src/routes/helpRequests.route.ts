@@ -1,10 +1,11 @@
 import { Router } from "express";
-import { getHelpRequests, helpRequests, resolveHelpRequest } from "../controllers/helpRequests.controller";
+import { batchHelpRequests, getHelpRequests, helpRequests, resolveHelpRequest } from "../controllers/helpRequests.controller";
 
 const helpRequestsRouter = Router({mergeParams: true});
 
 helpRequestsRouter.get("/", getHelpRequests);
 helpRequestsRouter.post("/", helpRequests);
+helpRequestsRouter.post("/batch", batchHelpRequests);
 helpRequestsRouter.patch("/:id", resolveHelpRequest);
 
 
@@ -1,5 +1,5 @@
 import { Router } from "express";
-import { addFromHelpRequest, addKnowledgeEntry, getKnowledgeBase, updateKnowledgeEntry,testKnowledgeRoute } from "../controllers/knowledge.controller";
+import { addFromHelpRequest, addKnowledgeEntry, deleteKnowledgeEntry, getKnowledgeBase, updateKnowledgeEntry,testKnowledgeRoute } from "../controllers/knowledge.controller";
 
 
 const knowledgeRouter = Router({mergeParams: true});
@@ -9,6 +9,7 @@ knowledgeRouter.get("/test", testKnowledgeRoute);
 knowledgeRouter.get("/", getKnowledgeBase);
 knowledgeRouter.post("/", addKnowledgeEntry);
 knowledgeRouter.put("/:id", updateKnowledgeEntry);
+knowledgeRouter.delete("/:id", deleteKnowledgeEntry);
 knowledgeRouter.post("/learn/:id", addFromHelpRequest);
 
 export default knowledgeRouter;
\ No newline at end of file